@@ -0,0 +1,126 @@
+"""
+Gemini Client Module
+====================
+Async client for the Gemini REST API:
+- generateContent for complete answers
+- streamGenerateContent (server-sent events) for streamed answers
+
+Requests go through a shared httpx.AsyncClient, so an in-flight LLM call
+waits on the event loop instead of holding a worker thread. Fixed instructions
+travel in the request's systemInstruction field, apart from the per-call prompt.
+"""
+
+import json
+from typing import AsyncIterator, Dict, Optional
+import httpx
+
+# ============================================
+# CONFIGURATION
+# ============================================
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+GEMINI_TIMEOUT = 60.0  # seconds
+
+
+class GeminiClient:
+    """Minimal async wrapper around the Gemini generateContent endpoints."""
+
+    def __init__(self, api_key: str, model: str,
+                 http: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            api_key: API key for Google Gemini
+            model: Model name, e.g. "gemini-2.5-flash"
+            http: Shared HTTP client (created on first use if omitted)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.http = http
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.http is None:
+            self.http = httpx.AsyncClient(timeout=GEMINI_TIMEOUT)
+        return self.http
+
+    def _url(self, method: str) -> str:
+        return f"{GEMINI_API_URL}/{self.model}:{method}"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key}
+
+    @staticmethod
+    def _body(prompt: str, system_instruction: Optional[str] = None) -> Dict:
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return body
+
+    @staticmethod
+    def _text(payload: Dict) -> str:
+        """Concatenate the text parts of the first candidate."""
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    async def generate(self, prompt: str, system_instruction: Optional[str] = None) -> str:
+        """
+        Generate a complete response.
+
+        Args:
+            prompt: Prompt text
+            system_instruction: Fixed instructions for the model (optional)
+
+        Returns:
+            Response text
+
+        Raises:
+            httpx.HTTPError: On transport errors or a non-2xx response
+            ValueError: If the response contains no text (e.g. blocked prompt)
+        """
+        response = await self._client().post(
+            self._url("generateContent"),
+            headers=self._headers(),
+            json=self._body(prompt, system_instruction)
+        )
+        response.raise_for_status()
+        payload = response.json()
+
+        text = self._text(payload)
+        if not text:
+            raise ValueError(f"Gemini returned no text: {payload.get('promptFeedback', payload)}")
+        return text
+
+    async def stream(self, prompt: str,
+                     system_instruction: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Generate a response, yielding text as it arrives.
+
+        Args:
+            prompt: Prompt text
+            system_instruction: Fixed instructions for the model (optional)
+
+        Yields:
+            Response text fragments
+
+        Raises:
+            httpx.HTTPError: On transport errors or a non-2xx response
+        """
+        async with self._client().stream(
+            "POST",
+            self._url("streamGenerateContent"),
+            params={"alt": "sse"},
+            headers=self._headers(),
+            json=self._body(prompt, system_instruction)
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                text = self._text(json.loads(line[len("data:"):]))
+                if text:
+                    yield text
@@ -8,15 +8,33 @@ Production-ready API for:
 """
 
 import os
+import abc
 import asyncio
-from typing import List, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+import orjson
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from rag_engine import RAGEngine
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from rag_engine import RAGEngine, normalize_query, new_file_hasher, file_hash_hexdigest
+from gemini_client import GEMINI_TIMEOUT
 
 from dotenv import load_dotenv
 
+# SIMD similarity kernels (optional)
+try:
+    import simsimd
+    
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
 # ============================================
 # CONFIGURATION
 # ============================================
@@ -27,11 +45,30 @@ load_dotenv()
 # Now read the API key from env
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
+# Uploads at or above this size are spooled to disk instead of read into memory
+SPOOL_THRESHOLD_BYTES = 4 * 1024 * 1024  # 4 MB
+
+# Uploads larger than this are rejected with 413
+MAX_PDF_BYTES = 200 * 1024 * 1024  # 200 MB
+PDF_MAGIC = b"%PDF-"
+
+# /ask answer cache
+ANSWER_CACHE_SIZE = 1024  # max cached answers
+ANSWER_CACHE_SIMILARITY = 0.95  # min cosine similarity for a semantic hit
+
+# Gemini REST client
+GEMINI_MAX_CONNECTIONS = 200  # concurrent in-flight Gemini requests
+
+# Concurrent /ask searches are coalesced into one multi-query FAISS search
+SEARCH_BATCH_MAX = 32  # max queries per batched embed or search
+SEARCH_BATCH_WAIT = 0.005  # seconds to wait for more queries to join a batch
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Multi-PDF RAG System",
     description="Production-ready RAG application with persistent embeddings",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware for React frontend
@@ -58,17 +95,21 @@ class RAGEngineWrapper:
         self._init_task: Optional[asyncio.Task] = None
         self._init_error: Optional[Exception] = None
 
-    async def start_background_init(self, gemini_api_key: str):
+    async def start_background_init(self, gemini_api_key: str,
+                                    http_client: Optional[httpx.AsyncClient] = None):
         """Start initializing the heavy RAGEngine in a background thread."""
         if self._init_task is None:
             print("Starting RAG Engine initialization in background...")
-            self._init_task = asyncio.create_task(self._init_in_thread(gemini_api_key))
+            self._init_task = asyncio.create_task(self._init_in_thread(gemini_api_key, http_client))
 
-    async def _init_in_thread(self, gemini_api_key: str):
+    async def _init_in_thread(self, gemini_api_key: str,
+                              http_client: Optional[httpx.AsyncClient] = None):
         """Run the blocking RAGEngine constructor in a worker thread."""
         try:
             # Move the heavy synchronous initialization off the main event loop
-            self.engine = await asyncio.to_thread(RAGEngine, gemini_api_key=gemini_api_key)
+            self.engine = await asyncio.to_thread(
+                RAGEngine, gemini_api_key=gemini_api_key, http_client=http_client
+            )
             self.ready = True
             print("✓ RAG Engine initialized successfully (background)")
         except Exception as e:
@@ -91,25 +132,402 @@ def get_rag_engine() -> RAGEngine:
     return RAG.engine
 
 
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the {MAX_PDF_BYTES // (1024 * 1024)} MB upload limit"
+    )
+
+
+async def _validate_upload(file: UploadFile):
+    """
+    Cheap checks before any parsing: size limit, then the %PDF- magic header.
+    
+    Raises:
+        HTTPException: 413 if the file is too large, 400 if it is not a PDF
+    """
+    if file.size is not None and file.size > MAX_PDF_BYTES:
+        raise _too_large()
+    
+    header = await file.read(len(PDF_MAGIC))
+    await file.seek(0)
+    if header != PDF_MAGIC:
+        raise HTTPException(status_code=400, detail="File is not a valid PDF")
+
+
+def _copy_and_hash(src, dst) -> str:
+    """Copy src to dst in 1 MB blocks, hashing the bytes on the way through."""
+    h = new_file_hasher()
+    total = 0
+    while chunk := src.read(1 << 20):
+        total += len(chunk)
+        if total > MAX_PDF_BYTES:
+            # Size was not known up front; stop copying as soon as the limit is hit
+            raise _too_large()
+        h.update(chunk)
+        dst.write(chunk)
+    return file_hash_hexdigest(h)
+
+
+async def _spool(file: UploadFile) -> Tuple[str, str]:
+    """Copy an upload to a named temp file; return its path and dedup hash."""
+    tmp_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        await file.seek(0)
+        file_hash = await asyncio.to_thread(_copy_and_hash, file.file, tmp_file)
+    except BaseException:
+        tmp_file.close()
+        os.unlink(tmp_file.name)
+        raise
+    tmp_file.close()
+    return tmp_file.name, file_hash
+
+
+async def _parse_upload(engine: RAGEngine, file: UploadFile,
+                        action: str) -> Tuple[Dict, List[Dict]]:
+    """Run the engine's parse stage on an upload, streaming large files through disk."""
+    await _validate_upload(file)
+    
+    if file.size is not None and file.size < SPOOL_THRESHOLD_BYTES:
+        # Small files: reading into memory is cheaper than the extra syscalls
+        content = await file.read()
+        return await asyncio.to_thread(
+            engine.parse_and_chunk,
+            filename=file.filename,
+            file_content=content,
+            action=action
+        )
+    
+    # Hash during the spool so duplicates never need a second pass over the file
+    path, file_hash = await _spool(file)
+    try:
+        return await asyncio.to_thread(
+            engine.parse_and_chunk,
+            filename=file.filename,
+            file_content=path,
+            action=action,
+            file_hash=file_hash
+        )
+    finally:
+        os.unlink(path)
+
+
+# ============================================
+# ANSWER CACHE
+# ============================================
+
+class SemanticCache:
+    """
+    Two-level LRU cache for /ask results.
+    
+    1. Exact match on the normalized question text and top_k.
+    2. Semantic match: query embeddings are bucketed by a random-hyperplane
+       LSH sketch, and a cached answer is returned when a candidate in the
+       same (or a one-bit-away) bucket has cosine similarity above the threshold.
+    
+    Embeddings live in one contiguous float32 matrix (a row per entry) so
+    candidates can be scored with SimSIMD's cosine kernels when installed.
+    
+    Only accessed from the event loop, so no locking is needed.
+    Every call carries the engine's index_version: a newer version drops
+    all entries, and results computed against an older one are not stored.
+    """
+    
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+                 num_planes: int = 8, seed: int = 0):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.num_planes = num_planes
+        self._rng = np.random.default_rng(seed)
+        self._planes: Optional[np.ndarray] = None  # sized on first embedding
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim) unit embeddings
+        self._free_rows: List[int] = []
+        self._entries: "OrderedDict[Tuple[str, int], Dict]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int], List[Tuple[str, int]]] = {}
+        self._version = 0  # index_version the cached answers were computed on
+    
+    @staticmethod
+    def _key(question: str, top_k: int) -> Tuple[str, int]:
+        return (normalize_query(question), top_k)
+    
+    def _sync(self, version: int) -> bool:
+        """Drop answers from an older corpus; False if version itself is outdated."""
+        if version > self._version:
+            self.clear()
+            self._version = version
+        return version == self._version
+    
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype="float32").ravel()
+        norm = float(np.linalg.norm(embedding))
+        return embedding / norm if norm > 0 else embedding
+    
+    def _sketch(self, unit_embedding: np.ndarray) -> int:
+        if self._planes is None or self._planes.shape[1] != unit_embedding.shape[0]:
+            self._planes = self._rng.standard_normal(
+                (self.num_planes, unit_embedding.shape[0])
+            ).astype("float32")
+        bits = (self._planes @ unit_embedding) > 0
+        return int(np.dot(bits, 1 << np.arange(self.num_planes)))
+    
+    @staticmethod
+    def _cosine_scores(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        if SIMSIMD_AVAILABLE:
+            distances = simsimd.cdist(query[None, :], matrix, metric="cosine")
+            return 1.0 - np.asarray(distances, dtype="float32").ravel()
+        # Rows and query are unit vectors, so the dot product is the cosine
+        return matrix @ query
+    
+    def get_exact(self, question: str, top_k: int, version: int) -> Optional[Dict]:
+        """Return the cached result for an identical question, if any."""
+        if not self._sync(version):
+            return None
+        key = self._key(question, top_k)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry["result"]
+    
+    def get_similar(self, embedding: np.ndarray, top_k: int, version: int) -> Optional[Dict]:
+        """Return the cached result for a near-identical question, if any."""
+        if not self._sync(version) or not self._entries:
+            return None
+        
+        query = self._unit(embedding)
+        sketch = self._sketch(query)
+        
+        # Probe the query's bucket plus all buckets one bit away
+        candidates: List[Tuple[str, int]] = []
+        for probe in [sketch] + [sketch ^ (1 << i) for i in range(self.num_planes)]:
+            candidates.extend(self._buckets.get((top_k, probe), ()))
+        if not candidates:
+            return None
+        
+        rows = [self._entries[key]["row"] for key in candidates]
+        scores = self._cosine_scores(query, self._matrix[rows])
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        
+        key = candidates[best]
+        self._entries.move_to_end(key)
+        return self._entries[key]["result"]
+    
+    def put(self, question: str, top_k: int, embedding: np.ndarray, result: Dict,
+            version: int):
+        """Cache a result, evicting the least recently used entry when full."""
+        if not self._sync(version):
+            return  # the corpus changed while this answer was generated
+        key = self._key(question, top_k)
+        if key in self._entries:
+            self._remove(key)
+        
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+        
+        unit = self._unit(embedding)
+        if self._matrix is None or self._matrix.shape[1] != unit.shape[0]:
+            self._matrix = np.empty((self.max_entries, unit.shape[0]), dtype="float32")
+            self._free_rows = list(range(self.max_entries - 1, -1, -1))
+            self._entries.clear()
+            self._buckets.clear()
+        
+        row = self._free_rows.pop()
+        self._matrix[row] = unit
+        sketch = self._sketch(unit)
+        self._entries[key] = {
+            "row": row,
+            "result": result,
+            "sketch": sketch,
+            "ts": time.time()
+        }
+        self._buckets.setdefault((top_k, sketch), []).append(key)
+    
+    def _remove(self, key: Tuple[str, int]):
+        entry = self._entries.pop(key)
+        self._free_rows.append(entry["row"])
+        bucket_key = (key[1], entry["sketch"])
+        bucket = self._buckets[bucket_key]
+        bucket.remove(key)
+        if not bucket:
+            del self._buckets[bucket_key]
+    
+    def clear(self):
+        """Drop all cached answers."""
+        self._entries.clear()
+        self._buckets.clear()
+        if self._matrix is not None:
+            self._free_rows = list(range(self.max_entries - 1, -1, -1))
+
+
+# Global answer cache
+ANSWER_CACHE = SemanticCache()
+
+
+# ============================================
+# REQUEST BATCHERS
+# ============================================
+
+class RequestBatcher(abc.ABC):
+    """
+    Coalesce concurrent per-request engine calls into one batched call.
+    
+    Callers queue an item and await a future; a background task collects
+    whatever arrives within max_wait (up to max_batch items), runs one
+    _process call in the thread pool and hands each caller its result.
+    Subclasses implement _process(engine, items) -> one result per item.
+    """
+    
+    def __init__(self, max_batch: int = SEARCH_BATCH_MAX,
+                 max_wait: float = SEARCH_BATCH_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the batching task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the batching task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._queue = None
+    
+    @abc.abstractmethod
+    def _process(self, engine: RAGEngine, items: List) -> List:
+        """Run one batched engine call; return one result per item, in order."""
+    
+    async def _submit(self, engine: RAGEngine, item):
+        """Queue one item and wait for its share of the batched result."""
+        if self._queue is None:
+            # Not started (e.g. app used without its startup event)
+            return (await asyncio.to_thread(self._process, engine, [item]))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((engine, item, future))
+        return await future
+    
+    async def _next_batch(self) -> List[Tuple]:
+        """Wait for one queued item, then gather more until full or timed out."""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            engine = batch[0][0]
+            
+            try:
+                results = await asyncio.to_thread(
+                    self._process, engine, [item for _, item, _ in batch]
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class EmbedBatcher(RequestBatcher):
+    """
+    Coalesce concurrent question embeddings into one encoder call
+    (engine.embed_queries), which also serves cache hits without encoding.
+    """
+    
+    async def embed(self, engine: RAGEngine, question: str) -> np.ndarray:
+        """Embed one question."""
+        return await self._submit(engine, question)
+    
+    def _process(self, engine: RAGEngine, questions: List[str]) -> List[np.ndarray]:
+        return list(engine.embed_queries(questions))
+
+
+class SearchBatcher(RequestBatcher):
+    """
+    Coalesce concurrent /ask searches into a single FAISS search.
+    Queries with different top_k share a search at the largest k and are
+    trimmed afterwards.
+    """
+    
+    async def search(self, engine: RAGEngine, query_embedding: np.ndarray,
+                     top_k: int) -> List[Dict]:
+        """Retrieve the top_k chunks for one query embedding."""
+        return await self._submit(engine, (query_embedding, top_k))
+    
+    def _process(self, engine: RAGEngine, items: List[Tuple[np.ndarray, int]]) -> List[List[Dict]]:
+        queries = np.stack([query for query, _ in items])
+        k = max(top_k for _, top_k in items)
+        results = engine.search_batch(queries, k)
+        return [chunks[:top_k] for (_, top_k), chunks in zip(items, results)]
+
+
+# Global batchers
+EMBED_BATCHER = EmbedBatcher()
+SEARCH_BATCHER = SearchBatcher()
+
+
 # ============================================
 # REQUEST/RESPONSE MODELS
 # ============================================
 
+# Immutable models; unknown fields are dropped rather than validated
+MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True)
+
+
 class QuestionRequest(BaseModel):
     """Request model for asking questions."""
+    model_config = MODEL_CONFIG
+
     question: str
     top_k: Optional[int] = 5
 
 
+class Source(BaseModel):
+    """Source citation for an answer."""
+    model_config = MODEL_CONFIG
+
+    file: str
+    page: int
+
+
 class QuestionResponse(BaseModel):
     """Response model for answers."""
+    model_config = MODEL_CONFIG
+
     answer: str
-    sources: List[dict]
+    sources: List[Source]
     num_chunks_used: int
 
 
 class UploadResponse(BaseModel):
     """Response model for file uploads."""
+    model_config = MODEL_CONFIG
+
     status: str
     filename: str
     message: str
@@ -123,6 +541,8 @@ class UploadResponse(BaseModel):
 
 class DuplicateActionRequest(BaseModel):
     """Request model for handling duplicate documents."""
+    model_config = MODEL_CONFIG
+
     filename: str
     file_hash: str
     action: str  # "use_existing", "replace", "cancel"
@@ -130,6 +550,8 @@ class DuplicateActionRequest(BaseModel):
 
 class DocumentInfo(BaseModel):
     """Document information model."""
+    model_config = MODEL_CONFIG
+
     doc_id: str
     filename: str
     hash: str
@@ -140,6 +562,8 @@ class DocumentInfo(BaseModel):
 
 class StatsResponse(BaseModel):
     """System statistics response."""
+    model_config = MODEL_CONFIG
+
     total_documents: int
     total_chunks: int
     index_size: int
@@ -149,6 +573,8 @@ class StatsResponse(BaseModel):
 
 class DeleteResponse(BaseModel):
     """Delete document response."""
+    model_config = MODEL_CONFIG
+
     status: str
     message: str
 
@@ -161,10 +587,32 @@ class DeleteResponse(BaseModel):
 async def startup_event():
     """Start RAG engine initialization in background - server becomes responsive immediately."""
     print("Starting Multi-PDF RAG System...")
-    await RAG.start_background_init(gemini_api_key=GEMINI_API_KEY)
+    # Size the default pool to the CPU so concurrent uploads actually run in parallel
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    )
+    # Shared connection pool for Gemini REST calls made from the event loop
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS),
+        timeout=GEMINI_TIMEOUT
+    )
+    EMBED_BATCHER.start()
+    SEARCH_BATCHER.start()
+    await RAG.start_background_init(gemini_api_key=GEMINI_API_KEY, http_client=app.state.http)
     print("Server ready! (RAG engine loading in background)")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks, write pending changes and close the HTTP client."""
+    await EMBED_BATCHER.stop()
+    await SEARCH_BATCHER.stop()
+    if RAG.engine is not None:
+        await asyncio.to_thread(RAG.engine.close)
+    await app.state.http.aclose()
+
+
 # ============================================
 # API ENDPOINTS
 # ============================================
@@ -185,12 +633,24 @@ async def ping():
     return {"ok": True}
 
 
+def _not_modified(request: Request, etag: str) -> bool:
+    """Return True if the client's If-None-Match already has this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request, response: Response):
     """Detailed health check - remains responsive even while engine loads."""
     if RAG.ready and RAG.engine is not None:
         try:
-            stats = await asyncio.to_thread(RAG.engine.get_stats)
+            # Cached snapshot: no thread hop or registry scan per poll
+            stats, etag = RAG.engine.get_stats_cached()
+            if _not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
             return {"status": "healthy", **stats}
         except Exception as e:
             return {"status": "error", "message": str(e)}
@@ -206,7 +666,7 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
     Upload multiple PDF files.
     
     - Accepts multiple PDF uploads
-    - Detects duplicates via SHA-256 hash
+    - Detects duplicates via BLAKE3 (or SHA-256) file hash
     - Returns duplicate warnings with options
     - Processes and embeds new documents
     """
@@ -214,59 +674,71 @@ async def upload_pdfs(files: List[UploadFile] = File(...)):
         raise HTTPException(status_code=503, detail="Engine is initializing, please try again in a moment")
     
     engine = RAG.engine
-    results = []
     
-    for file in files:
+    async def _parse(file: UploadFile) -> Tuple[Dict, List[Dict]]:
         # Validate file type
         if not file.filename.lower().endswith('.pdf'):
-            results.append(UploadResponse(
-                status="error",
-                filename=file.filename,
-                message="Only PDF files are allowed"
-            ))
-            continue
+            return {
+                "status": "error",
+                "filename": file.filename,
+                "message": "Only PDF files are allowed"
+            }, []
         
-        try:
-            # Read file content
-            content = await file.read()
-            
-            # Process document (run in thread to avoid blocking)
-            result = await asyncio.to_thread(
-                engine.upload_document,
-                filename=file.filename,
-                file_content=content,
-                action="auto"
-            )
-            
-            # Convert to response model
-            if result["status"] == "duplicate":
-                results.append(UploadResponse(
-                    status="duplicate",
-                    filename=result["filename"],
-                    message=result["message"],
-                    duplicate=True,
-                    existing_filename=result.get("existing_filename"),
-                    options=result.get("options"),
-                    hash=result.get("hash")
-                ))
-            else:
-                results.append(UploadResponse(
-                    status=result["status"],
-                    filename=result["filename"],
-                    message=result["message"],
-                    chunks=result.get("chunks"),
-                    pages=result.get("pages"),
-                    duplicate=False
-                ))
-                
-        except Exception as e:
-            results.append(UploadResponse(
-                status="error",
-                filename=file.filename,
-                message=f"Error processing file: {str(e)}"
+        # Extract and chunk the document (run in thread to avoid blocking)
+        return await _parse_upload(engine, file, action="auto")
+    
+    # Parse all files concurrently; each one is independent
+    outcomes = await asyncio.gather(*[_parse(f) for f in files], return_exceptions=True)
+    
+    parsed = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+            # Cancellation (client gone, shutdown) and the like are not
+            # per-file failures; let them end the request
+            raise outcome
+        if isinstance(outcome, HTTPException):
+            # Rejected by validation; report it for this file only
+            parsed.append(({
+                "status": "error",
+                "filename": file.filename,
+                "message": outcome.detail
+            }, []))
+        elif isinstance(outcome, Exception):
+            parsed.append(({
+                "status": "error",
+                "filename": file.filename,
+                "message": f"Error processing file: {str(outcome)}"
+            }, []))
+        else:
+            parsed.append(outcome)
+    
+    # Embed the chunks of every new document in a single batch
+    results = await asyncio.to_thread(engine.embed_and_index_batch, parsed)
+    
+    # Convert to response models
+    responses = []
+    for result in results:
+        if result["status"] == "duplicate":
+            responses.append(UploadResponse(
+                status="duplicate",
+                filename=result["filename"],
+                message=result["message"],
+                duplicate=True,
+                existing_filename=result.get("existing_filename"),
+                options=result.get("options"),
+                hash=result.get("hash")
+            ))
+        else:
+            responses.append(UploadResponse(
+                status=result["status"],
+                filename=result["filename"],
+                message=result["message"],
+                chunks=result.get("chunks"),
+                pages=result.get("pages"),
+                duplicate=False
             ))
     
-    return results
+    return responses
 
 
 @app.post("/handle-duplicate", response_model=UploadResponse)
@@ -294,13 +766,8 @@ async def handle_duplicate(
     engine = RAG.engine
     
     try:
-        content = await file.read()
-        result = await asyncio.to_thread(
-            engine.upload_document,
-            filename=file.filename,
-            file_content=content,
-            action=action
-        )
+        parsed = await _parse_upload(engine, file, action=action)
+        result = (await asyncio.to_thread(engine.embed_and_index_batch, [parsed]))[0]
         
         return UploadResponse(
             status=result["status"],
@@ -311,6 +778,8 @@ async def handle_duplicate(
             duplicate=result.get("reused", False)
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -340,7 +809,7 @@ async def ask_question(request: QuestionRequest):
         )
     
     # Check if any documents are uploaded
-    stats = await asyncio.to_thread(engine.get_stats)
+    stats, _ = engine.get_stats_cached()
     if stats["total_documents"] == 0:
         return QuestionResponse(
             answer="No documents have been uploaded yet. Please upload PDF documents first.",
@@ -348,12 +817,21 @@ async def ask_question(request: QuestionRequest):
             num_chunks_used=0
         )
     
+    top_k = request.top_k or 5
+    version = engine.index_version
+    
     try:
-        result = await asyncio.to_thread(
-            engine.ask,
-            query=request.question,
-            top_k=request.top_k or 5
-        )
+        result = ANSWER_CACHE.get_exact(request.question, top_k, version)
+        
+        if result is None:
+            query_embedding = await EMBED_BATCHER.embed(engine, request.question)
+            result = ANSWER_CACHE.get_similar(query_embedding, top_k, version)
+        
+        if result is None:
+            chunks = await SEARCH_BATCHER.search(engine, query_embedding, top_k)
+            # A Gemini failure raises here and becomes a 500; it is never cached
+            result = await engine.ask_async(request.question, chunks)
+            ANSWER_CACHE.put(request.question, top_k, query_embedding, result, version)
         
         return QuestionResponse(
             answer=result["answer"],
@@ -368,6 +846,105 @@ async def ask_question(request: QuestionRequest):
         )
 
 
+def _sse(data: Dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+
+async def _stream_answer(engine: RAGEngine, question: str, top_k: int) -> AsyncIterator[str]:
+    """
+    Yield an answer as SSE events while Gemini generates it.
+    
+    Gemini is streamed over the shared async HTTP client, so no worker
+    thread is held while tokens arrive. If generation fails, even after
+    some text went out, the stream ends with `event: error` and nothing
+    is cached.
+    """
+    version = engine.index_version
+    try:
+        result = ANSWER_CACHE.get_exact(question, top_k, version)
+        query_embedding = None
+        
+        if result is None:
+            query_embedding = await EMBED_BATCHER.embed(engine, question)
+            result = ANSWER_CACHE.get_similar(query_embedding, top_k, version)
+        
+        if result is not None:
+            yield _sse({"text": result["answer"]})
+            yield _sse({
+                "sources": result["sources"],
+                "num_chunks_used": result["num_chunks_used"]
+            }, event="sources")
+            return
+        
+        chunks = await SEARCH_BATCHER.search(engine, query_embedding, top_k)
+        context = engine.build_context(chunks)
+        
+        parts = []
+        async for text in engine.stream_answer_async(context, question):
+            parts.append(text)
+            yield _sse({"text": text})
+        
+        answer = "".join(parts)
+        sources = await engine.select_sources_async(question, answer, chunks)
+        result = {
+            "answer": answer,
+            "sources": sources,
+            "num_chunks_used": len(sources),
+            "num_chunks_retrieved": len(chunks)
+        }
+        # Reached only if the whole answer streamed without an error
+        if chunks:
+            ANSWER_CACHE.put(question, top_k, query_embedding, result, version)
+        
+        yield _sse({
+            "sources": sources,
+            "num_chunks_used": len(sources)
+        }, event="sources")
+        
+    except Exception as e:
+        yield _sse({"detail": f"Error generating answer: {str(e)}"}, event="error")
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Ask a question and stream the answer as server-sent events.
+    
+    - `data: {"text": ...}` events carry answer fragments as they are generated
+    - a final `event: sources` carries the verified source citations
+    - `event: error` is sent instead if generation fails mid-stream
+    """
+    if not RAG.ready or RAG.engine is None:
+        raise HTTPException(status_code=503, detail="Engine is initializing, please try again in a moment")
+    
+    engine = RAG.engine
+    
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Question cannot be empty"
+        )
+    
+    top_k = request.top_k or 5
+    
+    stats, _ = engine.get_stats_cached()
+    if stats["total_documents"] == 0:
+        async def _no_documents() -> AsyncIterator[str]:
+            yield _sse({"text": "No documents have been uploaded yet. Please upload PDF documents first."})
+            yield _sse({"sources": [], "num_chunks_used": 0}, event="sources")
+        body = _no_documents()
+    else:
+        body = _stream_answer(engine, request.question, top_k)
+    
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/documents", response_model=List[DocumentInfo])
 async def get_documents():
     """
@@ -428,13 +1005,16 @@ async def delete_document(doc_id: str):
 
 
 @app.get("/stats", response_model=StatsResponse)
-async def get_stats():
-    """Get system statistics."""
+async def get_stats(request: Request, response: Response):
+    """Get system statistics (supports If-None-Match / 304)."""
     if not RAG.ready or RAG.engine is None:
         raise HTTPException(status_code=503, detail="Engine is initializing, please try again in a moment")
     
     engine = RAG.engine
-    stats = await asyncio.to_thread(engine.get_stats)
+    stats, etag = engine.get_stats_cached()
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     
     return StatsResponse(
         total_documents=stats["total_documents"],
@@ -455,5 +1035,8 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        workers=1,  # more workers would all write the same backend/storage/ files
+        reload=False
     )
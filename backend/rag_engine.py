@@ -11,17 +11,32 @@ Handles all RAG pipeline operations:
 """
 
 import os
+import asyncio
 import json
+import platform
 import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from itertools import chain
+from typing import List, Dict, Tuple, Optional, Union, Iterator, AsyncIterator
 import numpy as np
+import orjson
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 import PyPDF2
 import google.generativeai as genai
+import httpx
 from PIL import Image
 import io
+import math
+import multiprocessing
+import re
+
+from gemini_client import GeminiClient
 
 # OCR imports (optional)
 try:
@@ -32,6 +47,60 @@ except ImportError:
     OCR_AVAILABLE = False
     print("Warning: pytesseract not installed. OCR functionality will be disabled.")
 
+# ONNX Runtime imports (optional, for EMBEDDING_BACKEND=onnx)
+try:
+    import onnxruntime
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# model2vec imports (optional, for EMBEDDING_BACKEND=model2vec)
+try:
+    from model2vec import StaticModel
+    
+    MODEL2VEC_AVAILABLE = True
+except ImportError:
+    MODEL2VEC_AVAILABLE = False
+
+# Zstandard imports (optional, for STORAGE_COMPRESS=1)
+try:
+    import zstandard
+    
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# PDFium imports (optional, native PDF text extraction; PyPDF2 is the fallback)
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+    
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+    print("Warning: pypdfium2 not installed. Falling back to PyPDF2 for text extraction.")
+
+# BLAKE3 imports (optional, faster document hashing; SHA-256 otherwise)
+try:
+    import blake3
+    
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+# Numba imports (optional, JIT-compiled chunking kernels)
+try:
+    from numba import njit
+    
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# GPU FAISS (faiss-gpu builds only; faiss-cpu reports no GPUs)
+FAISS_GPU_AVAILABLE = hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+
 # ============================================
 # CONFIGURATION
 # ============================================
@@ -39,19 +108,588 @@ except ImportError:
 # Paths for persistent storage
 STORAGE_DIR = os.path.join(os.path.dirname(__file__), "storage")
 FAISS_INDEX_PATH = os.path.join(STORAGE_DIR, "faiss.index")
+# Sign-bit index used instead of faiss.index with EMBEDDING_BINARY
+BINARY_INDEX_PATH = os.path.join(STORAGE_DIR, "faiss_binary.index")
 METADATA_PATH = os.path.join(STORAGE_DIR, "metadata.json")
 DOCUMENTS_PATH = os.path.join(STORAGE_DIR, "documents.json")
+# Append-only logs: float32 vectors for every chunk (in metadata order), and
+# chunk metadata added since the last index/metadata checkpoint
+EMBEDDINGS_PATH = os.path.join(STORAGE_DIR, "embeddings.f32")
+METADATA_LOG_PATH = os.path.join(STORAGE_DIR, "metadata.jsonl")
+# Embedding model the stored vectors came from
+EMBEDDING_INFO_PATH = os.path.join(STORAGE_DIR, "embedding_model.json")
+ZSTD_SUFFIX = ".zst"  # compressed copies are stored next to the plain paths
+# A removal rewrites the sidecar, so it stages every storage file under
+# STAGED_SUFFIX and makes the new set current once the marker exists
+STAGED_SUFFIX = ".new"
+COMMIT_MARKER_PATH = os.path.join(STORAGE_DIR, "commit.pending")
+ZSTD_LEVEL = 3
+
+# Exported model artifacts (e.g. the ONNX encoder) reused across restarts
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
 
 # Chunking parameters
 DEFAULT_CHUNK_SIZE = 200  # words per chunk
 DEFAULT_OVERLAP_SIZE = 50  # overlapping words
 
+# Chunks appended to the logs before the index and metadata are rewritten
+INDEX_CHECKPOINT_CHUNKS = 10_000
+
+# Read size used when streaming files from disk
+HASH_READ_SIZE = 1 << 20  # 1 MB
+
+# BLAKE3 document hashes are stored with this prefix; bare hex is SHA-256
+BLAKE3_HASH_PREFIX = "blake3:"
+FILE_HASH_PREFIX = BLAKE3_HASH_PREFIX if BLAKE3_AVAILABLE else ""
+
+# PDF extraction parameters
+# PDFs with at least this many pages are extracted in a process pool
+PDF_PARALLEL_MIN_PAGES = 16
+PDF_WORKERS = os.cpu_count() or 1
+
+# Shared process pool for page extraction, created on first use
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+_PDF_POOL_LOCK = threading.Lock()
+# PDFium is not thread-safe: every in-process call into it (concurrent
+# uploads parse on worker threads) goes through this lock
+_PDFIUM_LOCK = threading.Lock()
+
 # Retrieval parameters
 DEFAULT_TOP_K = 5  # number of chunks to retrieve
+QUERY_CACHE_SIZE = 2048  # query embeddings kept in the LRU cache
+
+# Answer returned when retrieval finds nothing to ground on
+NO_CONTEXT_ANSWER = "I don't have enough information to answer this question. Please upload relevant documents first."
+
+# FAISS index parameters
+# Small corpora use an exact flat index; once the corpus reaches
+# HNSW_MIN_VECTORS chunks it is rebuilt as an HNSW graph for sublinear search,
+# and past IVF_MIN_VECTORS as an OPQ + IVF-PQ index so it still fits in memory.
+# With EMBEDDING_QUANTIZE, vectors stay float32 until SQ_TRAIN_MIN_VECTORS have
+# accumulated, then the 8-bit quantizer is trained on all of them at once.
+HNSW_MIN_VECTORS = 1000
+SQ_TRAIN_MIN_VECTORS = 10_000
+HNSW_M = 32  # graph neighbors per node
+HNSW_EF_CONSTRUCTION = 200  # build-time candidate list size
+HNSW_EF_SEARCH = 64  # query-time candidate list size
+IVF_MIN_VECTORS = 1_000_000
+IVF_NLIST = 1024  # coarse clusters
+IVF_PQ_SUBVECTOR_DIMS = 8  # dims per PQ sub-quantizer (48 bytes per 384-d vector)
+IVF_NPROBE = 16  # clusters scanned per query
+# With EMBEDDING_BINARY, vectors are indexed by their sign bits (48 bytes per
+# 384-d vector) in a Hamming-distance flat index; the best
+# BINARY_RERANK_FACTOR * top_k candidates are re-scored with the exact
+# float32 vectors from the embeddings sidecar
+BINARY_RERANK_FACTOR = 4
+
+# Generation model
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+
+# Fixed instructions, sent as Gemini system instructions rather than
+# repeated at the top of every prompt
+ANSWER_SYSTEM_PROMPT = """You are a helpful assistant that answers questions based ONLY on the provided context.
+Do NOT make up information that is not in the context.
+If the context doesn't contain enough information to answer, say so clearly.
+You may summarize, combine, or rephrase information from the context to make your answer clear and helpful."""
+
+VERIFICATION_SYSTEM_PROMPT = """You are a citation verification assistant. Given a question, an answer, and numbered source chunks, identify which chunks were actually used to generate the answer.
+
+Return ONLY a comma-separated list of chunk numbers that directly support the answer (e.g., "0,2,3").
+If no chunks support the answer, return "NONE".
+Do not include explanations or any other text."""
 
 # Embedding model
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-EMBEDDING_DIMENSION = 384  # dimension of all-MiniLM-L6-v2 embeddings
+# Distilled static embeddings for EMBEDDING_BACKEND=model2vec
+MODEL2VEC_MODEL_NAME = "minishlab/potion-base-8M"
+EMBEDDING_BATCH_SIZE = 128  # texts per encoder forward pass
+# Bulk encodes on CPU-only hosts are spread over a pool of encoder processes
+EMBEDDING_POOL_MIN_CPUS = 5  # hosts with fewer cores stay single-process
+EMBEDDING_POOL_MIN_TEXTS = 1024  # smaller inputs are not worth the IPC
+EMBEDDING_POOL_THREADS = 4  # torch threads per encoder process
+ONNX_MODEL_DIR = os.path.join(MODELS_DIR, f"onnx-{EMBEDDING_MODEL_NAME}")
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean flag such as "true"/"false" from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a question for cache keys: lowercased, with runs of
+    whitespace collapsed. The embedding model is uncased, so this does not
+    change the embedding.
+    """
+    return " ".join(query.lower().split())
+
+
+def new_file_hasher():
+    """
+    Hasher for document dedup keys: multithreaded BLAKE3 when installed,
+    SHA-256 otherwise. The hash is only a dedup key, so SHA-256 skips the
+    FIPS wrapper (usedforsecurity=False).
+    """
+    if BLAKE3_AVAILABLE:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return hashlib.sha256(usedforsecurity=False)
+
+
+def file_hash_hexdigest(hasher) -> str:
+    """Stored form of a new_file_hasher() digest."""
+    return FILE_HASH_PREFIX + hasher.hexdigest()
+
+
+def _is_legacy_hash(file_hash: str) -> bool:
+    """True for SHA-256 hashes stored before BLAKE3 was in use."""
+    return BLAKE3_AVAILABLE and not file_hash.startswith(BLAKE3_HASH_PREFIX)
+
+
+def _hash_file(file_path: str, new_hasher=new_file_hasher) -> str:
+    """
+    Stream a file through a hasher in fixed-size blocks, returning hex.
+    Uses hashlib.file_digest (Python 3.11+) when available, which reads
+    into a reusable buffer and releases the GIL while hashing.
+    """
+    with open(file_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, new_hasher).hexdigest()
+        h = new_hasher()
+        while chunk := f.read(HASH_READ_SIZE):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+def _write_atomic(path: str, data: bytes):
+    """Write a file via a temp file and rename, so readers never see a partial file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _staged_files() -> List[str]:
+    """Storage files a staged commit may replace."""
+    return [DOCUMENTS_PATH, METADATA_PATH, EMBEDDINGS_PATH, FAISS_INDEX_PATH, BINARY_INDEX_PATH]
+
+
+def _finish_commit():
+    """
+    Move the staged copies of a commit into place, empty the metadata log
+    (the staged metadata already holds it) and drop the marker. Safe to
+    repeat after a crash part-way through.
+    """
+    for path in _staged_files():
+        for suffix, other in (("", ZSTD_SUFFIX), (ZSTD_SUFFIX, "")):
+            staged = path + STAGED_SUFFIX + suffix
+            if os.path.exists(staged):
+                os.replace(staged, path + suffix)
+                if os.path.exists(path + other):
+                    os.remove(path + other)
+    _write_atomic(METADATA_LOG_PATH, b"")
+    os.remove(COMMIT_MARKER_PATH)
+
+
+def _recover_commit():
+    """
+    Settle a staged commit interrupted by a crash: finish it if the marker
+    was written, otherwise discard the staged copies and keep the old set.
+    """
+    if os.path.exists(COMMIT_MARKER_PATH):
+        print("Finishing an interrupted storage commit")
+        _finish_commit()
+        return
+    for path in _staged_files():
+        for suffix in ("", ZSTD_SUFFIX):
+            if os.path.exists(path + STAGED_SUFFIX + suffix):
+                os.remove(path + STAGED_SUFFIX + suffix)
+
+
+def _stored_path(path: str) -> Optional[str]:
+    """Return the compressed or plain copy of a storage file, whichever exists."""
+    for candidate in (path + ZSTD_SUFFIX, path):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _open_pdf_stream(pdf_content: Union[bytes, str]):
+    """Open raw PDF bytes or a PDF path as a binary stream."""
+    if isinstance(pdf_content, (bytes, bytearray)):
+        return io.BytesIO(pdf_content)
+    # Let PyPDF2 read the file lazily instead of loading it whole
+    return open(pdf_content, "rb")
+
+
+def _extract_page(page, page_num: int) -> Optional[Dict]:
+    """
+    Extract text from a single PDF page, including OCR for images.
+    
+    Args:
+        page: PyPDF2 page object (fallback when pypdfium2 is missing)
+        page_num: Zero-based page index
+        
+    Returns:
+        Dict with page_num, text, and has_ocr, or None if the page is empty
+    """
+    # Extract regular text
+    text = page.extract_text()
+    ocr_text = ""
+    
+    # Extract images and apply OCR
+    if OCR_AVAILABLE:
+        try:
+            # Get images from page
+            if '/XObject' in page['/Resources']:
+                xObject = page['/Resources']['/XObject'].get_object()
+                
+                for obj in xObject:
+                    if xObject[obj]['/Subtype'] == '/Image':
+                        try:
+                            # Extract image data
+                            size = (xObject[obj]['/Width'], xObject[obj]['/Height'])
+                            data = xObject[obj].get_data()
+                            
+                            # Try to create image
+                            if xObject[obj]['/ColorSpace'] == '/DeviceRGB':
+                                mode = "RGB"
+                            elif xObject[obj]['/ColorSpace'] == '/DeviceGray':
+                                mode = "L"
+                            else:
+                                mode = "RGB"  # Default
+                            
+                            try:
+                                image = Image.frombytes(mode, size, data)
+                                # Apply OCR
+                                img_text = RAGEngine.extract_text_from_image(image)
+                                if img_text:
+                                    ocr_text += img_text + "\n"
+                            except Exception as img_error:
+                                # Try with PIL's open if frombytes fails
+                                try:
+                                    image = Image.open(io.BytesIO(data))
+                                    img_text = RAGEngine.extract_text_from_image(image)
+                                    if img_text:
+                                        ocr_text += img_text + "\n"
+                                except:
+                                    pass
+                        except Exception as e:
+                            # Skip this image if extraction fails
+                            continue
+        except Exception as e:
+            print(f"Error extracting images from page {page_num + 1}: {e}")
+    
+    return _page_record(page_num, text, ocr_text)
+
+
+def _read_pdfium_page(doc, page_num: int) -> Tuple[str, List[Image.Image]]:
+    """
+    Read the text and embedded images of one pypdfium2 page.
+    Must be called with _PDFIUM_LOCK held.
+    
+    Args:
+        doc: pypdfium2 PdfDocument
+        page_num: Zero-based page index
+        
+    Returns:
+        Tuple of (page text, images to OCR); images are copied out of
+        PDFium so OCR can run without the lock
+    """
+    page = doc[page_num]
+    try:
+        textpage = page.get_textpage()
+        try:
+            text = textpage.get_text_range()
+        finally:
+            textpage.close()
+        
+        images = []
+        if OCR_AVAILABLE:
+            try:
+                for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)):
+                    try:
+                        bitmap = obj.get_bitmap()
+                        try:
+                            images.append(bitmap.to_pil().copy())
+                        finally:
+                            bitmap.close()
+                    except pdfium.PdfiumError:
+                        # Skip this image if extraction fails
+                        continue
+            except Exception as e:
+                print(f"Error extracting images from page {page_num + 1}: {e}")
+        return text, images
+    finally:
+        page.close()
+
+
+def _ocr_images(images: List[Image.Image]) -> str:
+    """OCR images read by _read_pdfium_page, one text block per image."""
+    ocr_text = ""
+    for image in images:
+        img_text = RAGEngine.extract_text_from_image(image)
+        if img_text:
+            ocr_text += img_text + "\n"
+    return ocr_text
+
+
+def _page_record(page_num: int, text: Optional[str], ocr_text: str) -> Optional[Dict]:
+    """Combine regular text and OCR text into a page dict (None if empty)."""
+    combined_text = ""
+    if text and text.strip():
+        combined_text += text.strip()
+    if ocr_text.strip():
+        if combined_text:
+            combined_text += "\n\n[Text from images:]\n" + ocr_text.strip()
+        else:
+            combined_text = ocr_text.strip()
+    
+    if not combined_text:
+        return None
+    return {
+        "page_num": page_num + 1,
+        "text": combined_text,
+        "has_ocr": bool(ocr_text.strip())
+    }
+
+
+def _pdf_page_count(pdf_content: Union[bytes, str]) -> int:
+    """Count the pages of a PDF without extracting any text."""
+    if PDFIUM_AVAILABLE:
+        with _PDFIUM_LOCK:
+            doc = pdfium.PdfDocument(pdf_content)
+            try:
+                return len(doc)
+            finally:
+                doc.close()
+    with _open_pdf_stream(pdf_content) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def _extract_page_range(pdf_content: Union[bytes, str], start: int, stop: int) -> List[Dict]:
+    """Extract pages [start, stop) from a PDF (also the process-pool worker)."""
+    if PDFIUM_AVAILABLE:
+        # Lock per page rather than per document, so concurrent parses
+        # interleave and OCR runs outside the lock
+        with _PDFIUM_LOCK:
+            doc = pdfium.PdfDocument(pdf_content)
+        try:
+            pages = []
+            for i in range(start, stop):
+                with _PDFIUM_LOCK:
+                    text, images = _read_pdfium_page(doc, i)
+                pages.append(_page_record(i, text, _ocr_images(images)))
+        finally:
+            with _PDFIUM_LOCK:
+                doc.close()
+    else:
+        with _open_pdf_stream(pdf_content) as stream:
+            reader = PyPDF2.PdfReader(stream)
+            pages = [_extract_page(reader.pages[i], i) for i in range(start, stop)]
+    return [p for p in pages if p]
+
+
+def _chunk_pages(pages: List[Dict], filename: str, chunk_size: int,
+                 overlap_size: int) -> List[Dict]:
+    """Split extracted pages into chunk metadata dicts, in page order."""
+    chunks_metadata = []
+    for page_info in pages:
+        page_chunks = RAGEngine.chunk_text_with_overlap(
+            page_info["text"], 
+            chunk_size, 
+            overlap_size
+        )
+        for chunk_text in page_chunks:
+            chunks_metadata.append({
+                "text": chunk_text,
+                "source": filename,
+                "page": page_info["page_num"],
+                "has_ocr": page_info.get("has_ocr", False)
+            })
+    return chunks_metadata
+
+
+def _extract_and_chunk_range(pdf_content: Union[bytes, str], start: int, stop: int,
+                             filename: str, chunk_size: int, overlap_size: int) -> List[Dict]:
+    """Process-pool worker: extract and chunk pages [start, stop) from a PDF."""
+    pages = _extract_page_range(pdf_content, start, stop)
+    return _chunk_pages(pages, filename, chunk_size, overlap_size)
+
+
+def _map_page_ranges(worker, pdf_content: Union[bytes, str], *args) -> List[Dict]:
+    """
+    Run worker(pdf_content, start, stop, *args) over the PDF's pages and
+    concatenate the results in page order.
+    
+    Large PDFs get one contiguous page range per process-pool worker;
+    small ones (or single-CPU hosts) run in-process.
+    """
+    num_pages = _pdf_page_count(pdf_content)
+    if num_pages < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        return worker(pdf_content, 0, num_pages, *args)
+    
+    # One contiguous page range per worker keeps page order stable
+    step = -(-num_pages // PDF_WORKERS)
+    try:
+        pool = _get_pdf_pool()
+        futures = [
+            pool.submit(worker, pdf_content, start, min(start + step, num_pages), *args)
+            for start in range(0, num_pages, step)
+        ]
+        return list(chain.from_iterable(future.result() for future in futures))
+    except BrokenProcessPool:
+        print("PDF process pool failed, extracting pages serially")
+        _reset_pdf_pool()
+        return worker(pdf_content, 0, num_pages, *args)
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Create the shared PDF extraction process pool on first use."""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            # Forking this process is unsafe: torch/OpenMP and the asyncio
+            # thread pool may hold locks the children would inherit. Workers
+            # start from a clean forkserver (spawn where there is none) instead
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _PDF_POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+        return _PDF_POOL
+
+
+def _reset_pdf_pool():
+    """Drop a broken process pool so the next call creates a fresh one."""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is not None:
+            _PDF_POOL.shutdown(wait=False)
+        _PDF_POOL = None
+
+
+# ============================================
+# CHUNKING KERNELS
+# ============================================
+
+def _is_space(c) -> bool:
+    """True for the code points str.isspace() accepts."""
+    if 32 < c < 133:
+        return False  # fast path: printable ASCII
+    return ((9 <= c <= 13) or (28 <= c <= 32) or c == 133 or c == 160
+            or c == 5760 or (8192 <= c <= 8202) or c == 8232 or c == 8233
+            or c == 8239 or c == 8287 or c == 12288)
+
+
+def _word_offsets_kernel(codes: np.ndarray) -> np.ndarray:
+    """
+    Find the [start, end) character offsets of every whitespace-separated
+    word in an array of code points, matching str.split().
+    """
+    n = codes.shape[0]
+    num_words = 0
+    prev_space = True
+    for i in range(n):
+        space = _is_space(codes[i])
+        if prev_space and not space:
+            num_words += 1
+        prev_space = space
+    
+    offsets = np.empty((num_words, 2), dtype=np.int64)
+    w = 0
+    prev_space = True
+    for i in range(n):
+        space = _is_space(codes[i])
+        if prev_space and not space:
+            offsets[w, 0] = i
+        elif space and not prev_space:
+            offsets[w, 1] = i
+            w += 1
+        prev_space = space
+    if not prev_space:
+        offsets[w, 1] = n
+    return offsets
+
+
+def _chunk_offsets(offsets: np.ndarray, window: int, stride: int) -> np.ndarray:
+    """
+    Turn word offsets into (n_chunks, 2) character [start, end) spans for
+    windows of `window` words starting every `stride` words.
+    """
+    n = offsets.shape[0]
+    num_chunks = (n + stride - 1) // stride
+    spans = np.empty((num_chunks, 2), dtype=np.int64)
+    for c in range(num_chunks):
+        first = c * stride
+        last = min(first + window, n) - 1
+        spans[c, 0] = offsets[first, 0]
+        spans[c, 1] = offsets[last, 1]
+    return spans
+
+
+if NUMBA_AVAILABLE:
+    # cache=True keeps the compiled kernels on disk across restarts
+    _is_space = njit(cache=True, inline="always")(_is_space)
+    _word_offsets_kernel = njit(cache=True)(_word_offsets_kernel)
+    _chunk_offsets = njit(cache=True)(_chunk_offsets)
+
+
+def _block_chunk_spans(text: str, window: int, stride: int) -> List[Tuple[int, int]]:
+    """
+    Pure-Python counterpart of _word_offsets + _chunk_offsets.
+    
+    Every window and stride is a whole number of blocks of gcd(window, stride)
+    words, so the regex engine matches one block at a time and Python only
+    touches one match per block instead of one per word.
+    """
+    block = math.gcd(window, stride)
+    spans = [m.span() for m in re.finditer(r"\S+(?:\s+\S+){0,%d}" % (block - 1), text)]
+    n = len(spans)
+    window_blocks, stride_blocks = window // block, stride // block
+    return [
+        (spans[i][0], spans[min(i + window_blocks, n) - 1][1])
+        for i in range(0, n, stride_blocks)
+    ]
+
+
+def _word_offsets(text: str) -> np.ndarray:
+    """Character offsets of the words in text, shape (n_words, 2)."""
+    # One array element per code point, so indices match str indices
+    if text.isascii():
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return _word_offsets_kernel(codes)
+
+
+class StaticEmbedder:
+    """
+    model2vec StaticModel behind the part of the SentenceTransformer
+    encode() interface the engine uses. An embedding is a token lookup
+    plus a mean, so there is no padding or forward pass to batch around.
+    """
+    
+    def __init__(self, model_name: str):
+        self.model = StaticModel.from_pretrained(model_name)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.dim
+    
+    def encode(self, sentences: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+               show_progress_bar: bool = False, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        embeddings = np.ascontiguousarray(
+            self.model.encode(sentences, batch_size=batch_size, show_progress_bar=show_progress_bar),
+            dtype=np.float32
+        )
+        if normalize_embeddings:
+            faiss.normalize_L2(embeddings)
+        return embeddings
 
 
 class RAGEngine:
@@ -63,78 +701,692 @@ class RAGEngine:
     - Persistence of all data
     """
     
-    def __init__(self, gemini_api_key: str):
+    def __init__(self, gemini_api_key: str, http_client: Optional[httpx.AsyncClient] = None):
         """
         Initialize the RAG Engine.
         
         Args:
             gemini_api_key: API key for Google Gemini
+            http_client: Shared async HTTP client for the Gemini REST API (optional)
         """
         # Ensure storage directory exists
         os.makedirs(STORAGE_DIR, exist_ok=True)
         
+        # Size the compute thread pools before the model spins up its own
+        self.compute_threads = self._configure_threads()
+        
         # Initialize embedding model
         print("Loading embedding model...")
-        self.embed_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        self.embedding_backend = os.environ.get("EMBEDDING_BACKEND", "torch").strip().lower()
+        self.embedding_model_name = EMBEDDING_MODEL_NAME
+        self.embed_model = self._load_embedding_model()
+        self.embedding_dimension = self.embed_model.get_sentence_embedding_dimension()
         
         # Initialize Gemini
         genai.configure(api_key=gemini_api_key)
-        self.gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+        self.gemini_model = genai.GenerativeModel(
+            GEMINI_MODEL_NAME, system_instruction=ANSWER_SYSTEM_PROMPT
+        )
+        self.verification_model = genai.GenerativeModel(
+            GEMINI_MODEL_NAME, system_instruction=VERIFICATION_SYSTEM_PROMPT
+        )
+        self.gemini_client = GeminiClient(gemini_api_key, GEMINI_MODEL_NAME, http=http_client)
+        
+        # Multi-process encoding pool for bulk uploads, started on first use.
+        # The ONNX encoder cannot be shipped to worker processes, and a GPU
+        # is already saturated by a single process.
+        self.use_encode_pool = (
+            _env_flag("EMBEDDING_MULTIPROCESS", default=True)
+            and self.embedding_backend == "torch"
+            and not torch.cuda.is_available()
+            and (os.cpu_count() or 1) >= EMBEDDING_POOL_MIN_CPUS
+        )
+        self._encode_pool: Optional[Dict] = None
+        self._encode_pool_lock = threading.Lock()
+        
+        # Store vectors as 8-bit scalar-quantized codes instead of float32
+        self.quantize_embeddings = _env_flag("EMBEDDING_QUANTIZE")
+        
+        # Index sign bits in a binary index and re-rank from the sidecar;
+        # takes precedence over EMBEDDING_QUANTIZE
+        self.binary_index = _env_flag("EMBEDDING_BINARY")
+        self._rerank_vectors: Optional[np.ndarray] = None  # mmap'd sidecar
+        self._rerank_vectors_version = -1
+        
+        # zstd-compress storage files (an IVF index can then no longer be mmap'd)
+        self.compress_storage = _env_flag("STORAGE_COMPRESS")
+        if self.compress_storage and not ZSTD_AVAILABLE:
+            print("Warning: zstandard not installed; storing files uncompressed")
+            self.compress_storage = False
+        
+        # Seconds between background saves; 0 saves synchronously on every change
+        self.persist_interval = float(os.environ.get("PERSIST_INTERVAL", "0") or 0)
+        self._dirty = False
+        self._pending_adds = 0  # chunks in the metadata log, not yet checkpointed
+        self._checkpoint_due = False  # set when the index must be rewritten in full
+        self._pending_embeddings: Optional[np.ndarray] = None  # sidecar after a removal
+        self._flusher_stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
         
         # Initialize or load FAISS index
-        self.index: Optional[faiss.IndexFlatL2] = None
+        self.index: Optional[faiss.Index] = None
+        self._index_mmapped = False  # True while self.index reads IVF lists from the mmap'd file
         self.metadata: List[Dict] = []  # Stores chunk text, source, page
         self.documents: Dict[str, Dict] = {}  # Document registry
+        self.index_version = 0  # bumped whenever the indexed chunks change
+        
+        # GPU replica of self.index for search, rebuilt after changes. The CPU
+        # index stays canonical for mutation, persistence and mmap.
+        self.use_gpu_search = (
+            FAISS_GPU_AVAILABLE and _env_flag("FAISS_GPU", default=True)
+            and not self.binary_index
+        )
+        self._gpu_resources = None
+        self._gpu_index: Optional[faiss.Index] = None
+        self._gpu_index_version = -1
+        # Lookup indices over the registry (first doc_id registered wins)
+        self._hash_to_doc_id: Dict[str, str] = {}
+        self._filename_to_doc_id: Dict[str, str] = {}
+        self._legacy_hash_count = 0  # registry entries still keyed by SHA-256
+        
+        # Guards index, metadata and registry so uploads can run concurrently
+        self._lock = threading.RLock()
+        
+        # LRU of query embeddings keyed by a digest of the query text
+        self._query_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
+        # (stats, ETag) snapshot kept current on every mutation so reads are free
+        self._stats_snapshot: Tuple[Dict, str] = ({}, "")
         
         # Load existing data if available
         self._load_persistent_data()
+        self._update_stats()
+        
+        if self.persist_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
         
         print(f"RAG Engine initialized. Documents: {len(self.documents)}, Chunks: {len(self.metadata)}")
     
+    @staticmethod
+    def _configure_threads() -> int:
+        """
+        Give PyTorch (query and upload encoding) and FAISS (search and index
+        builds) an explicit share of the cores. Both default to one OpenMP
+        thread per core, so the two pools oversubscribe the CPU and stall
+        each other when an encode and a search overlap.
+        
+        Returns:
+            Threads per pool (COMPUTE_THREADS, default half the cores)
+        """
+        threads = int(os.environ.get("COMPUTE_THREADS", "0") or 0)
+        if threads <= 0:
+            threads = max(1, (os.cpu_count() or 1) // 2)
+        faiss.omp_set_num_threads(threads)
+        torch.set_num_threads(threads)
+        # Inherited by worker processes that do not set their own
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+        return threads
+    
+    def _load_embedding_model(self) -> Union[SentenceTransformer, StaticEmbedder]:
+        """
+        Load the SentenceTransformer, optionally as an int8-quantized ONNX
+        Runtime model or replaced by model2vec static embeddings, and warm it
+        up so the first request is fast.
+        
+        Returns:
+            Ready-to-use encoder
+        """
+        model = None
+        
+        if self.embedding_backend == "model2vec":
+            if MODEL2VEC_AVAILABLE:
+                try:
+                    model = StaticEmbedder(MODEL2VEC_MODEL_NAME)
+                    self.embedding_model_name = MODEL2VEC_MODEL_NAME
+                    print(f"Using model2vec static embeddings ({MODEL2VEC_MODEL_NAME})")
+                except Exception as e:
+                    print(f"Warning: model2vec load failed ({e}); using PyTorch embeddings")
+            else:
+                print("Warning: model2vec not installed; using PyTorch embeddings")
+        elif self.embedding_backend == "onnx":
+            if ONNX_AVAILABLE:
+                try:
+                    model = self._load_onnx_model()
+                    print("Using int8-quantized ONNX Runtime embeddings")
+                except Exception as e:
+                    print(f"Warning: ONNX export failed ({e}); using PyTorch embeddings")
+            else:
+                print("Warning: sentence-transformers[onnx] not installed; using PyTorch embeddings")
+        
+        if model is None:
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        
+        # Warm-up pass pays one-time initialization before the first request
+        model.encode(["warm-up"], show_progress_bar=False)
+        return model
+    
+    @staticmethod
+    def _onnx_quantization_target() -> str:
+        """Pick the dynamic int8 quantization config matching this CPU."""
+        if platform.machine().lower() in ("arm64", "aarch64"):
+            return "arm64"
+        try:
+            with open("/proc/cpuinfo", "r") as f:
+                flags = f.read()
+        except OSError:
+            return "avx2"
+        if "avx512_vnni" in flags:
+            return "avx512_vnni"
+        if "avx512" in flags:
+            return "avx512"
+        return "avx2"
+    
+    @staticmethod
+    def _load_onnx_model() -> SentenceTransformer:
+        """
+        Load the int8 dynamically-quantized ONNX encoder, exporting and
+        quantizing it into ONNX_MODEL_DIR on first run.
+        
+        Returns:
+            SentenceTransformer running on ONNX Runtime
+        """
+        target = RAGEngine._onnx_quantization_target()
+        file_name = f"onnx/model_qint8_{target}.onnx"
+        
+        if not os.path.exists(os.path.join(ONNX_MODEL_DIR, file_name)):
+            # First run: export once and keep it for later restarts
+            print(f"Exporting embedding model to ONNX ({target} int8)...")
+            onnx_model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+            onnx_model.save_pretrained(ONNX_MODEL_DIR)
+            export_dynamic_quantized_onnx_model(onnx_model, target, ONNX_MODEL_DIR)
+        
+        return SentenceTransformer(
+            ONNX_MODEL_DIR,
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"}
+        )
+    
     # ============================================
     # PERSISTENCE METHODS
     # ============================================
     
     def _load_persistent_data(self):
         """Load FAISS index, metadata, and document registry from disk."""
+        _recover_commit()
         
         # Load document registry
-        if os.path.exists(DOCUMENTS_PATH):
-            with open(DOCUMENTS_PATH, "r", encoding="utf-8") as f:
-                self.documents = json.load(f)
+        documents = self._load_json(DOCUMENTS_PATH)
+        if documents is not None:
+            self.documents = documents
+            for doc_id, doc_info in self.documents.items():
+                self._index_document(doc_id, doc_info)
             print(f"Loaded {len(self.documents)} documents from registry")
+            if not BLAKE3_AVAILABLE:
+                blake3_keyed = sum(
+                    1 for doc_info in self.documents.values()
+                    if doc_info.get("hash", "").startswith(BLAKE3_HASH_PREFIX)
+                )
+                if blake3_keyed:
+                    print(f"Warning: {blake3_keyed} documents are keyed by BLAKE3 hashes "
+                          "but blake3 is not installed; re-uploads of them will not "
+                          "be detected as duplicates")
         
         # Load metadata
-        if os.path.exists(METADATA_PATH):
-            with open(METADATA_PATH, "r", encoding="utf-8") as f:
-                self.metadata = json.load(f)
+        metadata = self._load_json(METADATA_PATH)
+        if metadata is not None:
+            self.metadata = metadata
             print(f"Loaded {len(self.metadata)} chunks metadata")
         
-        # Load FAISS index
-        if os.path.exists(FAISS_INDEX_PATH) and len(self.metadata) > 0:
-            self.index = faiss.read_index(FAISS_INDEX_PATH)
+        # Stores from before the model was recorded were embedded with MiniLM
+        stored_model = self._load_json(EMBEDDING_INFO_PATH)
+        stored_name = (stored_model or {}).get("model", EMBEDDING_MODEL_NAME)
+        if stored_name == self.embedding_model_name:
+            self._load_index()
+        else:
+            # Vectors from another model are not comparable with this one's queries
+            print(f"Stored vectors come from {stored_name}; re-embedding with {self.embedding_model_name}")
+            self._reembed_corpus()
+        
+        model_info = {"model": self.embedding_model_name, "dimension": self.embedding_dimension}
+        if stored_model != model_info:
+            self._save_json(EMBEDDING_INFO_PATH, model_info)
+        
+        if self._checkpoint_due:
+            # Replay upgraded the index tier or dropped orphaned chunks
+            self._save_persistent_data()
+    
+    def _load_index(self):
+        """Load the FAISS index checkpoint and replay the logs on top of it."""
+        index_path = _stored_path(self._index_path())
+        if index_path is not None and len(self.metadata) > 0:
+            if index_path.endswith(ZSTD_SUFFIX):
+                with open(index_path, "rb") as f:
+                    data = zstandard.ZstdDecompressor().decompress(f.read())
+                data = np.frombuffer(data, dtype=np.uint8)
+                if self.binary_index:
+                    self.index = faiss.deserialize_index_binary(data)
+                else:
+                    self.index = faiss.deserialize_index(data)
+                self._configure_index(self.index)
+                self._index_mmapped = False
+            else:
+                self.index = self._read_index(mmap=True)
             print(f"Loaded FAISS index with {self.index.ntotal} vectors")
+            
+            if self.index.ntotal != len(self.metadata):
+                # Left over from before EMBEDDING_BINARY was toggled, or from
+                # a checkpoint interrupted between metadata and index
+                print("FAISS index does not match the metadata; rebuilding it")
+                self._rebuild_index()
+            elif not self.binary_index and self.index.metric_type == faiss.METRIC_L2:
+                # Index from before cosine search: normalize and rebuild as inner product
+                embeddings = self.index.reconstruct_n(0, self.index.ntotal)
+                faiss.normalize_L2(embeddings)
+                self.index = self._build_index(embeddings)
+                self._index_mmapped = False
+                self._write_index()
+                _write_atomic(EMBEDDINGS_PATH, embeddings.tobytes())
+                print("Migrated FAISS index from L2 to inner product")
+        elif self.metadata:
+            # No index of this kind has been written yet (e.g. EMBEDDING_BINARY
+            # was just turned on): build it from the stored vectors
+            self._rebuild_index()
         else:
             # Create new empty index
-            self.index = faiss.IndexFlatL2(EMBEDDING_DIMENSION)
+            self.index = self._create_index()
             print("Created new FAISS index")
+        
+        self._replay_log()
+    
+    def _rebuild_index(self):
+        """
+        Build the index for the checkpointed chunks from the embeddings
+        sidecar, writing the sidecar first if it is missing, and save it.
+        """
+        embeddings = self._stored_embeddings(len(self.metadata))
+        if embeddings is None:
+            self.index = self._create_index()
+            embeddings = self._backfill_embeddings()
+        self.index = self._build_index(np.ascontiguousarray(embeddings))
+        self._index_mmapped = False
+        self._write_index()
+        print(f"Built {type(self.index).__name__} with {self.index.ntotal} vectors")
+    
+    def _reembed_corpus(self):
+        """
+        Rebuild the index, sidecar and checkpoint from chunk text with the
+        current embedding model, after it changed.
+        """
+        tail, _ = self._read_metadata_log()
+        keep = self._registered_mask(tail)
+        self.metadata.extend(c for c, kept in zip(tail, keep) if kept)
+        if self.metadata:
+            embeddings = self.generate_embeddings([m["text"] for m in self.metadata])
+        else:
+            embeddings = np.empty((0, self.embedding_dimension), dtype=np.float32)
+        self.index = self._build_index(embeddings)
+        self._index_mmapped = False
+        _write_atomic(EMBEDDINGS_PATH, embeddings.tobytes())
+        self._checkpoint()
+    
+    def _replay_log(self):
+        """
+        Add chunks appended to the sidecar and metadata log since the last
+        checkpoint, and trim whatever a crash left half-written.
+        """
+        tail, torn = self._read_metadata_log()
+        base = len(self.metadata)
+        vectors = self._open_embeddings()
+        if vectors is None or len(vectors) < base:
+            # Storage from before the sidecar existed
+            vectors = self._backfill_embeddings()
+        
+        # Vectors are appended before metadata, so a logged chunk without
+        # a vector was never fully added
+        replayed = min(len(tail), len(vectors) - base)
+        logged = tail[:replayed]
+        logged_vectors = np.array(vectors[base:base + replayed])
+        
+        # Chunks are logged before their document is registered, so a crash
+        # in between leaves chunks no registry entry accounts for
+        keep = self._registered_mask(logged)
+        if not keep.all():
+            logged = [c for c, kept in zip(logged, keep) if kept]
+            logged_vectors = np.ascontiguousarray(logged_vectors[keep])
+            print(f"Dropped {replayed - len(logged)} logged chunks of unregistered documents")
+            # The sidecar and log still hold them: rewrite both at the next save
+            self._pending_embeddings = np.concatenate([vectors[:base], logged_vectors])
+            self._checkpoint_due = True
+        
+        if logged:
+            self._add_embeddings(logged_vectors)
+            self.metadata.extend(logged)
+            self._pending_adds = len(logged)
+            print(f"Replayed {len(logged)} chunks from the metadata log")
+        total = base + replayed
+        del vectors
+        
+        row_bytes = self.embedding_dimension * 4
+        if os.path.exists(EMBEDDINGS_PATH) and os.path.getsize(EMBEDDINGS_PATH) != total * row_bytes:
+            os.truncate(EMBEDDINGS_PATH, total * row_bytes)
+        if replayed < len(tail) or torn:
+            _write_atomic(METADATA_LOG_PATH, self._log_lines(tail[:replayed]))
+    
+    def _registered_mask(self, logged: List[Dict]) -> np.ndarray:
+        """
+        Mark the logged chunks the registry accounts for: per source file,
+        the registered num_chunks minus what the checkpoint already holds,
+        in log order.
+        """
+        if not logged:
+            return np.ones(0, dtype=bool)
+        budget = Counter()
+        for doc_info in self.documents.values():
+            budget[doc_info["filename"]] += doc_info.get("num_chunks", 0)
+        budget.subtract(m["source"] for m in self.metadata)
+        
+        keep = np.zeros(len(logged), dtype=bool)
+        for i, chunk in enumerate(logged):
+            if budget[chunk["source"]] > 0:
+                budget[chunk["source"]] -= 1
+                keep[i] = True
+        return keep
+    
+    @staticmethod
+    def _read_metadata_log() -> Tuple[List[Dict], bool]:
+        """
+        Read chunks from the metadata log, stopping at a torn final line.
+        
+        Returns:
+            Tuple of (chunks, whether a torn line was dropped)
+        """
+        if not os.path.exists(METADATA_LOG_PATH):
+            return [], False
+        chunks = []
+        with open(METADATA_LOG_PATH, "rb") as f:
+            for line in f:
+                try:
+                    chunks.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    return chunks, True
+        return chunks, False
+    
+    def _open_embeddings(self) -> Optional[np.ndarray]:
+        """Memory-map the embeddings sidecar read-only, or None if absent."""
+        if not os.path.exists(EMBEDDINGS_PATH):
+            return None
+        rows = os.path.getsize(EMBEDDINGS_PATH) // (self.embedding_dimension * 4)
+        if rows == 0:
+            return np.empty((0, self.embedding_dimension), dtype=np.float32)
+        return np.memmap(EMBEDDINGS_PATH, dtype=np.float32, mode="r",
+                         shape=(rows, self.embedding_dimension))
+    
+    def _stored_embeddings(self, count: int) -> Optional[np.ndarray]:
+        """
+        First count vectors from the embeddings sidecar (memory-mapped,
+        read-only), or None if the sidecar holds fewer rows.
+        """
+        vectors = self._open_embeddings()
+        if vectors is None or len(vectors) < count:
+            return None
+        return vectors[:count]
+    
+    def _backfill_embeddings(self) -> np.ndarray:
+        """
+        Write the embeddings sidecar for the checkpointed chunks, recovering
+        vectors from the index where it can reconstruct them and
+        re-embedding otherwise.
+        
+        Returns:
+            Float32 array of shape (len(metadata), embedding_dimension)
+        """
+        if not self.metadata:
+            embeddings = np.empty((0, self.embedding_dimension), dtype=np.float32)
+        else:
+            embeddings = None
+            if self.index.ntotal == len(self.metadata) and not self.binary_index:
+                try:
+                    ivf = faiss.try_extract_index_ivf(self.index)
+                    if ivf is not None:
+                        ivf.make_direct_map()
+                    embeddings = self.index.reconstruct_n(0, self.index.ntotal)
+                except RuntimeError as e:
+                    print(f"Warning: could not reconstruct vectors from the index ({e})")
+            if embeddings is None:
+                embeddings = self.generate_embeddings([m["text"] for m in self.metadata])
+            print(f"Wrote embeddings sidecar for {len(embeddings)} chunks")
+        _write_atomic(EMBEDDINGS_PATH, embeddings.tobytes())
+        return embeddings
+    
+    @staticmethod
+    def _log_lines(chunks_metadata: List[Dict]) -> bytes:
+        return b"".join(orjson.dumps(c) + b"\n" for c in chunks_metadata)
+    
+    def _append_log(self, chunks_metadata: List[Dict], embeddings: np.ndarray):
+        """
+        Append new chunks to the embeddings sidecar and metadata log, so a
+        save only costs O(new chunks) until the next checkpoint.
+        Must be called with the lock held.
+        """
+        with open(EMBEDDINGS_PATH, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with open(METADATA_LOG_PATH, "ab") as f:
+            f.write(self._log_lines(chunks_metadata))
+        self._pending_adds += len(chunks_metadata)
+    
+    @staticmethod
+    def _load_json(path: str):
+        """Load a JSON storage file from its compressed or plain copy, or None if absent."""
+        stored = _stored_path(path)
+        if stored is None:
+            return None
+        with open(stored, "rb") as f:
+            data = f.read()
+        if stored.endswith(ZSTD_SUFFIX):
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return orjson.loads(data)
+    
+    def _write_storage_file(self, path: str, data):
+        """
+        Atomically write a storage file, zstd-compressed when enabled, and
+        drop the copy in the other format so loads never pick up a stale one.
+        """
+        if self.compress_storage:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+            target, stale = path + ZSTD_SUFFIX, path
+            data = compressor.compress(data)
+        else:
+            target, stale = path, path + ZSTD_SUFFIX
+        _write_atomic(target, data)
+        if os.path.exists(stale):
+            os.remove(stale)
+    
+    def _save_json(self, path: str, obj):
+        # Compact orjson output: these are machine files, and pretty printing
+        # roughly doubled their size and save time
+        self._write_storage_file(path, orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
+    
+    def _index_path(self) -> str:
+        return BINARY_INDEX_PATH if self.binary_index else FAISS_INDEX_PATH
+    
+    def _read_index(self, mmap: bool = False) -> faiss.Index:
+        """
+        Read the persisted FAISS index.
+        
+        With mmap=True, FAISS is asked to map the file read-only. The pinned
+        FAISS only maps the inverted lists of IVF indexes (the IVF-PQ tier);
+        flat, HNSW and binary indexes are read onto the heap regardless, so
+        they are treated as ordinary in-memory indexes.
+        
+        Args:
+            mmap: Map the file read-only where FAISS supports it
+            
+        Returns:
+            Configured FAISS index
+        """
+        read = faiss.read_index_binary if self.binary_index else faiss.read_index
+        index_path = self._index_path()
+        index = None
+        if mmap:
+            try:
+                index = read(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError as e:
+                print(f"Warning: could not mmap FAISS index ({e}); loading into memory")
+        if index is None:
+            index = read(index_path)
+        self._index_mmapped = mmap and self._is_mapped(index)
+        self._configure_index(index)
+        return index
+    
+    @staticmethod
+    def _is_mapped(index) -> bool:
+        """True if FAISS actually mapped the index's data (IVF lists read as on-disk lists)."""
+        if isinstance(index, faiss.IndexBinary):
+            return False
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            return False
+        return isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+    
+    def _ensure_index_writable(self):
+        """Swap a read-only mmap'd index for an in-memory copy before mutating it."""
+        if self._index_mmapped:
+            self.index = self._read_index()
+            print("Loaded FAISS index into memory for writing")
+    
+    def _write_index(self, index_path: Optional[str] = None):
+        """
+        Write the FAISS index atomically. The rename also means processes that
+        still have the previous file mapped keep reading a consistent copy.
+        The index file of the other EMBEDDING_BINARY mode is deleted, so
+        switching back rebuilds it instead of loading a stale one.
+        
+        Args:
+            index_path: Where to write (defaults to the mode's index path)
+        """
+        index_path = index_path or self._index_path()
+        if self.compress_storage:
+            if self.binary_index:
+                data = faiss.serialize_index_binary(self.index)
+            else:
+                data = faiss.serialize_index(self.index)
+            self._write_storage_file(index_path, data)
+        else:
+            tmp_path = index_path + ".tmp"
+            if self.binary_index:
+                faiss.write_index_binary(self.index, tmp_path)
+            else:
+                faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, index_path)
+            if os.path.exists(index_path + ZSTD_SUFFIX):
+                os.remove(index_path + ZSTD_SUFFIX)
+        
+        other_path = FAISS_INDEX_PATH if self.binary_index else BINARY_INDEX_PATH
+        for stale in (other_path, other_path + ZSTD_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
     
     def _save_persistent_data(self):
-        """Save FAISS index, metadata, and document registry to disk."""
+        """
+        Save the document registry, and checkpoint the FAISS index and
+        metadata once the log holds INDEX_CHECKPOINT_CHUNKS chunks or the
+        index was rebuilt (tier upgrade, removal). A removal's new sidecar
+        goes through a staged commit instead.
+        """
+        if self._pending_embeddings is not None:
+            self._commit_staged()
+            print("Persistent data saved successfully")
+            return
         
         # Save document registry
-        with open(DOCUMENTS_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.documents, f, indent=2, ensure_ascii=False)
+        self._save_json(DOCUMENTS_PATH, self.documents)
+        
+        if self._checkpoint_due or self._pending_adds >= INDEX_CHECKPOINT_CHUNKS:
+            self._checkpoint()
+        
+        print("Persistent data saved successfully")
+    
+    def _commit_staged(self):
+        """
+        Write the registry, metadata, index and the pending sidecar as staged
+        copies, then the commit marker, then move them into place. A crash
+        before the marker keeps the old files; after it, _recover_commit
+        finishes the move on the next start. Either way the sidecar, metadata
+        and log stay aligned.
+        """
+        _write_atomic(EMBEDDINGS_PATH + STAGED_SUFFIX, self._pending_embeddings.tobytes())
+        self._save_json(DOCUMENTS_PATH + STAGED_SUFFIX, self.documents)
+        self._save_json(METADATA_PATH + STAGED_SUFFIX, self.metadata)
+        if self.index is not None and self.index.ntotal > 0:
+            self._write_index(self._index_path() + STAGED_SUFFIX)
+        
+        _write_atomic(COMMIT_MARKER_PATH, b"")
+        _finish_commit()
+        self._pending_embeddings = None
+        self._pending_adds = 0
+        self._checkpoint_due = False
+    
+    def _checkpoint(self):
+        """Rewrite metadata and the FAISS index in full, then empty the metadata log."""
         
         # Save metadata
-        with open(METADATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f, indent=2, ensure_ascii=False)
+        self._save_json(METADATA_PATH, self.metadata)
         
         # Save FAISS index
-        if self.index is not None and self.index.ntotal > 0:
-            faiss.write_index(self.index, FAISS_INDEX_PATH)
+        if self.index is not None and self.index.ntotal > 0 and not self._index_mmapped:
+            self._write_index()
         
-        print("Persistent data saved successfully")
+        # Everything in the log is now part of the checkpoint
+        _write_atomic(METADATA_LOG_PATH, b"")
+        self._pending_adds = 0
+        self._checkpoint_due = False
+    
+    def _persist(self):
+        """
+        Save after a mutation. Must be called with the lock held.
+        New chunks are already on disk in the append-only logs, so this is
+        usually just the registry.
+        With PERSIST_INTERVAL set, only marks the data dirty and lets the
+        flusher thread batch consecutive mutations into one write. Removals
+        and tier upgrades still checkpoint immediately.
+        """
+        if self.persist_interval > 0 and not self._checkpoint_due:
+            self._dirty = True
+        else:
+            self._save_persistent_data()
+            self._dirty = False
+    
+    def flush(self):
+        """Write pending changes to disk, if any."""
+        with self._lock:
+            if self._dirty:
+                self._save_persistent_data()
+                self._dirty = False
+    
+    def _flush_loop(self):
+        while not self._flusher_stop.wait(self.persist_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error saving persistent data: {e}")
+    
+    def close(self):
+        """Stop background workers and write any pending changes."""
+        self._flusher_stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self._stop_encode_pool()
+        self.flush()
+    
+    def __del__(self):
+        # Worker processes would otherwise outlive an engine that was never closed
+        try:
+            self._stop_encode_pool()
+        except Exception:
+            pass
     
     # ============================================
     # DOCUMENT PROCESSING METHODS
@@ -143,15 +1395,30 @@ class RAGEngine:
     @staticmethod
     def compute_file_hash(file_content: bytes) -> str:
         """
-        Compute SHA-256 hash of file content.
+        Compute the dedup hash of file content (BLAKE3, or SHA-256 without blake3).
         
         Args:
             file_content: Raw bytes of the file
             
         Returns:
-            Hexadecimal hash string
+            Hash string, "blake3:"-prefixed for BLAKE3
         """
-        return hashlib.sha256(file_content).hexdigest()
+        hasher = new_file_hasher()
+        hasher.update(file_content)
+        return file_hash_hexdigest(hasher)
+    
+    @staticmethod
+    def compute_path_hash(file_path: str) -> str:
+        """
+        Compute the dedup hash of a file on disk without reading it into memory.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Hash string, "blake3:"-prefixed for BLAKE3
+        """
+        return FILE_HASH_PREFIX + _hash_file(file_path)
     
     @staticmethod
     def chunk_text_with_overlap(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, 
@@ -167,18 +1434,17 @@ class RAGEngine:
         Returns:
             List of text chunks
         """
-        words = text.split()
-        chunks = []
-        start = 0
+        if not NUMBA_AVAILABLE:
+            spans = _block_chunk_spans(text, chunk_size, chunk_size - overlap_size)
+            return [text[start:end] for start, end in spans]
         
-        while start < len(words):
-            end = start + chunk_size
-            chunk = " ".join(words[start:end])
-            if chunk.strip():  # Only add non-empty chunks
-                chunks.append(chunk)
-            start += chunk_size - overlap_size
+        offsets = _word_offsets(text)
+        if len(offsets) == 0:
+            return []
         
-        return chunks
+        # Chunk boundaries are computed on word offsets, then sliced from the text
+        spans = _chunk_offsets(offsets, chunk_size, chunk_size - overlap_size)
+        return [text[start:end] for start, end in spans.tolist()]
     
     @staticmethod
     def extract_text_from_image(image: Image.Image) -> str:
@@ -206,91 +1472,26 @@ class RAGEngine:
             print(f"OCR error: {e}")
             return ""
     
-    def extract_text_from_pdf(self, pdf_content: bytes) -> List[Dict]:
+    def extract_text_from_pdf(self, pdf_content: Union[bytes, str]) -> List[Dict]:
         """
         Extract text from PDF page by page, including OCR for images.
+        Uses pypdfium2 (native PDFium) when installed, PyPDF2 otherwise.
+        Large PDFs are split into page ranges extracted in a process pool;
+        PDFium is not thread-safe, so each worker opens its own document.
         
         Args:
-            pdf_content: Raw bytes of PDF file
+            pdf_content: Raw bytes of PDF file, or path to the PDF on disk
             
         Returns:
             List of dicts with page_num, text, and ocr_text
         """
-        pages = []
-        
         try:
-            reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            for page_num, page in enumerate(reader.pages):
-                # Extract regular text
-                text = page.extract_text()
-                ocr_text = ""
-                
-                # Extract images and apply OCR
-                if OCR_AVAILABLE:
-                    try:
-                        # Get images from page
-                        if '/XObject' in page['/Resources']:
-                            xObject = page['/Resources']['/XObject'].get_object()
-                            
-                            for obj in xObject:
-                                if xObject[obj]['/Subtype'] == '/Image':
-                                    try:
-                                        # Extract image data
-                                        size = (xObject[obj]['/Width'], xObject[obj]['/Height'])
-                                        data = xObject[obj].get_data()
-                                        
-                                        # Try to create image
-                                        if xObject[obj]['/ColorSpace'] == '/DeviceRGB':
-                                            mode = "RGB"
-                                        elif xObject[obj]['/ColorSpace'] == '/DeviceGray':
-                                            mode = "L"
-                                        else:
-                                            mode = "RGB"  # Default
-                                        
-                                        try:
-                                            image = Image.frombytes(mode, size, data)
-                                            # Apply OCR
-                                            img_text = self.extract_text_from_image(image)
-                                            if img_text:
-                                                ocr_text += img_text + "\n"
-                                        except Exception as img_error:
-                                            # Try with PIL's open if frombytes fails
-                                            try:
-                                                image = Image.open(io.BytesIO(data))
-                                                img_text = self.extract_text_from_image(image)
-                                                if img_text:
-                                                    ocr_text += img_text + "\n"
-                                            except:
-                                                pass
-                                    except Exception as e:
-                                        # Skip this image if extraction fails
-                                        continue
-                    except Exception as e:
-                        print(f"Error extracting images from page {page_num + 1}: {e}")
-                
-                # Combine regular text and OCR text
-                combined_text = ""
-                if text and text.strip():
-                    combined_text += text.strip()
-                if ocr_text.strip():
-                    if combined_text:
-                        combined_text += "\n\n[Text from images:]\n" + ocr_text.strip()
-                    else:
-                        combined_text = ocr_text.strip()
-                
-                if combined_text:
-                    pages.append({
-                        "page_num": page_num + 1,
-                        "text": combined_text,
-                        "has_ocr": bool(ocr_text.strip())
-                    })
+            return _map_page_ranges(_extract_page_range, pdf_content)
         except Exception as e:
             print(f"Error extracting PDF text: {e}")
             raise
-        
-        return pages
     
-    def process_pdf(self, filename: str, file_content: bytes, 
+    def process_pdf(self, filename: str, file_content: Union[bytes, str], 
                     chunk_size: int = DEFAULT_CHUNK_SIZE,
                     overlap_size: int = DEFAULT_OVERLAP_SIZE) -> List[Dict]:
         """
@@ -298,33 +1499,20 @@ class RAGEngine:
         
         Args:
             filename: Original filename
-            file_content: Raw bytes of PDF
+            file_content: Raw bytes of PDF, or path to the PDF on disk
             chunk_size: Words per chunk
             overlap_size: Overlap between chunks
             
         Returns:
             List of chunk metadata dicts
         """
-        # Extract pages
-        pages = self.extract_text_from_pdf(file_content)
-        
-        # Chunk each page
-        chunks_metadata = []
-        for page_info in pages:
-            page_chunks = self.chunk_text_with_overlap(
-                page_info["text"], 
-                chunk_size, 
-                overlap_size
-            )
-            for chunk_text in page_chunks:
-                chunks_metadata.append({
-                    "text": chunk_text,
-                    "source": filename,
-                    "page": page_info["page_num"],
-                    "has_ocr": page_info.get("has_ocr", False)
-                })
-        
-        return chunks_metadata
+        # Extract and chunk together, so large PDFs are also chunked in the pool
+        try:
+            return _map_page_ranges(_extract_and_chunk_range, file_content,
+                                    filename, chunk_size, overlap_size)
+        except Exception as e:
+            print(f"Error extracting PDF text: {e}")
+            raise
     
     # ============================================
     # DUPLICATE DETECTION METHODS
@@ -335,15 +1523,13 @@ class RAGEngine:
         Check if a document with the same hash already exists.
         
         Args:
-            file_hash: SHA-256 hash of the file
+            file_hash: Dedup hash of the file (compute_file_hash)
             
         Returns:
             Document info if duplicate found, None otherwise
         """
-        for doc_id, doc_info in self.documents.items():
-            if doc_info.get("hash") == file_hash:
-                return {"doc_id": doc_id, **doc_info}
-        return None
+        doc_id = self._hash_to_doc_id.get(file_hash)
+        return {"doc_id": doc_id, **self.documents[doc_id]} if doc_id else None
     
     def get_document_by_filename(self, filename: str) -> Optional[Dict]:
         """
@@ -355,10 +1541,83 @@ class RAGEngine:
         Returns:
             Document info if found, None otherwise
         """
-        for doc_id, doc_info in self.documents.items():
-            if doc_info.get("filename") == filename:
-                return {"doc_id": doc_id, **doc_info}
-        return None
+        doc_id = self._filename_to_doc_id.get(filename)
+        return {"doc_id": doc_id, **self.documents[doc_id]} if doc_id else None
+    
+    def _upgrade_legacy_hash(self, filename: str, file_hash: str,
+                             file_content: Union[bytes, str]):
+        """
+        Re-key a document registered under its SHA-256 hash (from before
+        BLAKE3 was installed) to file_hash, so re-uploads are still detected
+        as duplicates. The registry picks the new hash up on its next save.
+        
+        Only an upload sharing the legacy document's filename pays for the
+        extra SHA-256 pass, so a legacy entry that is never re-uploaded
+        costs other uploads nothing; the same content under a new name is
+        not matched until the entry has been re-keyed.
+        
+        Args:
+            filename: Original filename of the upload
+            file_hash: New-style hash of the upload
+            file_content: Raw bytes of the upload, or path to it on disk
+        """
+        if not self._legacy_hash_count or file_hash in self._hash_to_doc_id:
+            return
+        
+        with self._lock:
+            doc_id = self._filename_to_doc_id.get(filename)
+            legacy_hash = self.documents[doc_id].get("hash") if doc_id else None
+        if not legacy_hash or not _is_legacy_hash(legacy_hash):
+            return
+        
+        if isinstance(file_content, (bytes, bytearray)):
+            upload_hash = hashlib.sha256(file_content).hexdigest()
+        else:
+            upload_hash = _hash_file(file_content, hashlib.sha256)
+        if upload_hash != legacy_hash:
+            return
+        
+        with self._lock:
+            # The document may have been removed or re-keyed meanwhile
+            doc_info = self.documents.get(doc_id)
+            if doc_info is None or doc_info.get("hash") != legacy_hash:
+                return
+            if self._hash_to_doc_id.get(legacy_hash) == doc_id:
+                del self._hash_to_doc_id[legacy_hash]
+            doc_info["hash"] = file_hash
+            self._hash_to_doc_id.setdefault(file_hash, doc_id)
+            self._legacy_hash_count -= 1
+    
+    def _index_document(self, doc_id: str, doc_info: Dict):
+        """Add a registry entry to the hash and filename lookup indices."""
+        if doc_info.get("hash"):
+            self._hash_to_doc_id.setdefault(doc_info["hash"], doc_id)
+            if _is_legacy_hash(doc_info["hash"]):
+                self._legacy_hash_count += 1
+        if doc_info.get("filename"):
+            self._filename_to_doc_id.setdefault(doc_info["filename"], doc_id)
+    
+    def _register_document(self, doc_id: str, doc_info: Dict):
+        """Add a document to the registry and its lookup indices."""
+        self.documents[doc_id] = doc_info
+        self._index_document(doc_id, doc_info)
+    
+    def _unregister_document(self, doc_id: str):
+        """Remove a document from the registry and its lookup indices."""
+        doc_info = self.documents.pop(doc_id)
+        if doc_info.get("hash") and _is_legacy_hash(doc_info["hash"]):
+            self._legacy_hash_count -= 1
+        for index, field in ((self._hash_to_doc_id, "hash"),
+                             (self._filename_to_doc_id, "filename")):
+            key = doc_info.get(field)
+            if index.get(key) != doc_id:
+                continue
+            del index[key]
+            # Fall back to the next document sharing this key, if any
+            for other_id, other_info in self.documents.items():
+                if other_info.get(field) == key:
+                    index[key] = other_id
+                    break
     
     # ============================================
     # EMBEDDING AND INDEXING METHODS
@@ -366,23 +1625,279 @@ class RAGEngine:
     
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
-        Generate embeddings for a list of texts.
+        Generate L2-normalized embeddings for a list of texts.
         
         Args:
             texts: List of text strings
             
         Returns:
-            Numpy array of embeddings
+            Numpy array of unit-length embeddings
+        """
+        if len(texts) <= EMBEDDING_BATCH_SIZE or isinstance(self.embed_model, StaticEmbedder):
+            # Static embeddings have no padding, so sorting would not help
+            embeddings = self.embed_model.encode(
+                texts,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        else:
+            # encode() only sorts by character count; batch by token count
+            # instead so each batch pads to a similar length
+            max_len = self.embed_model.max_seq_length
+            token_ids = self.embed_model.tokenizer(
+                texts, add_special_tokens=False, truncation=False, verbose=False
+            )["input_ids"]
+            order = np.argsort([min(len(ids), max_len) for ids in token_ids], kind="stable")
+            
+            embeddings = np.empty((len(texts), self.embedding_dimension), dtype="float32")
+            if self.use_encode_pool and len(texts) >= EMBEDDING_POOL_MIN_TEXTS:
+                # Workers take contiguous slices of the sorted list, so their
+                # batches stay length-homogeneous too
+                sorted_embeddings = self.embed_model.encode_multi_process(
+                    [texts[i] for i in order],
+                    self._get_encode_pool(),
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    chunk_size=EMBEDDING_BATCH_SIZE * 4,
+                    normalize_embeddings=True
+                )
+                embeddings[order] = sorted_embeddings
+                return embeddings
+            
+            for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+                batch = order[start:start + EMBEDDING_BATCH_SIZE]
+                # Scatter back to input order so metadata stays aligned
+                embeddings[batch] = self.embed_model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+        # encode() already returns unit-length float32 rows; this only
+        # guarantees the layout FAISS expects without copying
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _get_encode_pool(self) -> Dict:
+        """Start the multi-process encoding pool on first use."""
+        with self._encode_pool_lock:
+            if self._encode_pool is None:
+                cpus = os.cpu_count() or 1
+                workers = max(2, cpus // EMBEDDING_POOL_THREADS)
+                # Split the cores between workers instead of letting each
+                # spawned process start one torch thread per core
+                previous = os.environ.get("OMP_NUM_THREADS")
+                os.environ["OMP_NUM_THREADS"] = str(max(1, cpus // workers))
+                try:
+                    self._encode_pool = self.embed_model.start_multi_process_pool(["cpu"] * workers)
+                finally:
+                    if previous is None:
+                        del os.environ["OMP_NUM_THREADS"]
+                    else:
+                        os.environ["OMP_NUM_THREADS"] = previous
+                print(f"Started {workers} embedding worker processes")
+            return self._encode_pool
+    
+    def _stop_encode_pool(self):
+        with self._encode_pool_lock:
+            if self._encode_pool is not None:
+                SentenceTransformer.stop_multi_process_pool(self._encode_pool)
+                self._encode_pool = None
+    
+    @staticmethod
+    def _configure_index(index: faiss.Index):
+        """Apply query-time parameters that are not persisted with the index."""
+        if isinstance(index, faiss.IndexBinary):
+            return
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is not None:
+                ivf.nprobe = IVF_NPROBE
+    
+    @staticmethod
+    def _index_tier(index: faiss.Index) -> int:
+        """
+        0 for float32 flat, 1 for float32 HNSW, 2 for 8-bit scalar-quantized
+        HNSW, 3 for IVF-PQ. Indexes only ever move up a tier.
+        The binary index has a single tier, 0.
+        """
+        if isinstance(index, faiss.IndexBinary):
+            return 0
+        if faiss.try_extract_index_ivf(index) is not None:
+            return 3
+        if isinstance(index, faiss.IndexHNSWSQ):
+            return 2
+        if isinstance(index, faiss.IndexHNSW):
+            return 1
+        return 0
+    
+    def _tier_for(self, num_vectors: int) -> int:
+        """Index tier _create_index picks for a corpus of num_vectors."""
+        if self.binary_index:
+            return 0
+        if num_vectors >= IVF_MIN_VECTORS:
+            return 3
+        if self.quantize_embeddings and num_vectors >= SQ_TRAIN_MIN_VECTORS:
+            return 2
+        if num_vectors >= HNSW_MIN_VECTORS:
+            return 1
+        return 0
+    
+    def _create_index(self, num_vectors: int = 0) -> faiss.Index:
+        """
+        Create an empty FAISS index suited to the corpus size.
+        Embeddings are L2-normalized, so every variant uses inner product
+        (cosine similarity) rather than L2 distance.
+        
+        Args:
+            num_vectors: Number of vectors the index will hold
+            
+        Returns:
+            Flat index for small corpora, HNSW for medium ones and OPQ +
+            IVF-PQ for very large ones. With EMBEDDING_QUANTIZE enabled,
+            corpora past SQ_TRAIN_MIN_VECTORS use an HNSW graph over 8-bit
+            codes instead of float32. Quantized and IVF-PQ indexes must be trained before
+            the first add. With EMBEDDING_BINARY, always a binary flat
+            index over the vectors' sign bits.
+        """
+        tier = self._tier_for(num_vectors)
+        dim = self.embedding_dimension
+        if self.binary_index:
+            return faiss.IndexBinaryFlat(dim)
+        if tier == 3:
+            pq_m = dim // IVF_PQ_SUBVECTOR_DIMS
+            index = faiss.index_factory(
+                dim, f"OPQ{pq_m},IVF{IVF_NLIST},PQ{pq_m}",
+                faiss.METRIC_INNER_PRODUCT
+            )
+        elif tier == 2:
+            # SQ_TRAIN_MIN_VECTORS is past HNSW_MIN_VECTORS, so the
+            # quantized tier is always a graph
+            index = faiss.IndexHNSWSQ(
+                dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif tier == 1:
+            index = faiss.IndexHNSWFlat(
+                dim, HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        else:
+            index = faiss.IndexFlatIP(dim)
+        self._configure_index(index)
+        return index
+    
+    def _build_index(self, embeddings: np.ndarray) -> faiss.Index:
+        """
+        Build a new FAISS index containing the given embeddings.
+        
+        Args:
+            embeddings: Float32 array of shape (n, embedding_dimension)
+            
+        Returns:
+            Populated FAISS index
+        """
+        index = self._create_index(len(embeddings))
+        if len(embeddings):
+            if not index.is_trained:
+                index.train(embeddings)
+            index.add(self._index_codes(embeddings))
+        return index
+    
+    def _index_codes(self, embeddings: np.ndarray) -> np.ndarray:
+        """Vectors in the form the index takes: packed sign bits for the binary index."""
+        if self.binary_index:
+            return np.packbits(embeddings > 0, axis=1)
+        return embeddings
+    
+    def _add_embeddings(self, embeddings: np.ndarray):
+        """
+        Add embeddings to the index, rebuilding it whenever the corpus grows
+        into a higher tier (HNSW, scalar-quantized, IVF-PQ).
+        Must be called with the lock held.
+        
+        Args:
+            embeddings: Float32 array of shape (n, embedding_dimension)
+        """
+        self._ensure_index_writable()
+        total = self.index.ntotal + len(embeddings)
+        if self._tier_for(total) > self._index_tier(self.index):
+            # Rebuild from the exact stored vectors (or what the index can
+            # reconstruct) without re-embedding; quantizers train on
+            # everything accumulated
+            existing = self._stored_embeddings(self.index.ntotal)
+            if existing is None:
+                existing = self.index.reconstruct_n(0, self.index.ntotal)
+            self.index = self._build_index(np.vstack([existing, embeddings]))
+            # Checkpoint it, or every restart would replay into the old tier
+            # and rebuild again
+            self._checkpoint_due = True
+            print(f"Upgraded FAISS index to {type(self.index).__name__} ({total} vectors)")
+        else:
+            if not self.index.is_trained:
+                # Index loaded untrained: learn the quantizer from this batch
+                self.index.train(embeddings)
+            self.index.add(self._index_codes(embeddings))
+    
+    def _prepare_tier_upgrade(self, embeddings: np.ndarray) -> Optional[Tuple[faiss.Index, int, int]]:
+        """
+        Build the next-tier index for the current corpus without holding the
+        lock, when adding embeddings will cross a tier boundary. Training
+        OPQ + IVF-PQ on a million vectors takes minutes, and every search
+        would stall behind it. Call without the lock held.
+        
+        Args:
+            embeddings: Float32 array of the vectors about to be added
+            
+        Returns:
+            (index holding the current vectors, index_version it was built
+            from, size once the batch is added), or None if no upgrade is due
+        """
+        with self._lock:
+            total = self.index.ntotal + len(embeddings)
+            if self._tier_for(total) <= self._index_tier(self.index):
+                return None
+            version = self.index_version
+            # The sidecar is append-only between removals, and a removal
+            # replaces the file, so this mapping stays valid unlocked
+            existing = self._stored_embeddings(self.index.ntotal)
+            if existing is None:
+                existing = self.index.reconstruct_n(0, self.index.ntotal)
+        
+        index = self._create_index(total)
+        if not index.is_trained:
+            # Quantizers train on everything accumulated plus the new batch
+            index.train(np.vstack([existing, embeddings]))
+        if len(existing):
+            index.add(self._index_codes(np.ascontiguousarray(existing)))
+        return index, version, total
+    
+    def _install_tier_upgrade(self, prepared: Optional[Tuple[faiss.Index, int, int]]):
+        """
+        Swap in an index from _prepare_tier_upgrade, unless the indexed chunks
+        changed meanwhile (then _add_embeddings upgrades under the lock).
+        Must be called with the lock held.
         """
-        embeddings = self.embed_model.encode(texts)
-        return np.array(embeddings).astype("float32")
+        if prepared is None or prepared[1] != self.index_version:
+            return
+        self.index, _, total = prepared
+        self._index_mmapped = False
+        self._checkpoint_due = True
+        # The caller adds the batch right after the swap
+        print(f"Upgraded FAISS index to {type(self.index).__name__} ({total} vectors)")
     
-    def add_to_index(self, chunks_metadata: List[Dict]) -> int:
+    def add_to_index(self, chunks_metadata: List[Dict],
+                     embeddings: Optional[np.ndarray] = None) -> int:
         """
         Add new chunks to FAISS index and metadata.
         
         Args:
             chunks_metadata: List of chunk dicts with text, source, page
+            embeddings: Precomputed embeddings for the chunks (optional)
             
         Returns:
             Number of chunks added
@@ -390,155 +1905,402 @@ class RAGEngine:
         if not chunks_metadata:
             return 0
         
-        # Extract texts for embedding
-        texts = [c["text"] for c in chunks_metadata]
-        
-        # Generate embeddings
-        embeddings = self.generate_embeddings(texts)
+        if embeddings is None:
+            # Extract texts for embedding
+            texts = [c["text"] for c in chunks_metadata]
+            
+            # Generate embeddings
+            embeddings = self.generate_embeddings(texts)
         
+        prepared = self._prepare_tier_upgrade(embeddings)
+        with self._lock:
+            self._install_tier_upgrade(prepared)
+            return self._add_chunks(chunks_metadata, embeddings)
+    
+    def _add_chunks(self, chunks_metadata: List[Dict], embeddings: np.ndarray) -> int:
+        """add_to_index() with embeddings in hand. Must be called with the lock held."""
         # Add to FAISS index
-        self.index.add(embeddings)
+        self._add_embeddings(embeddings)
         
         # Add to metadata
         self.metadata.extend(chunks_metadata)
+        self._append_log(chunks_metadata, embeddings)
+        self.index_version += 1
+        self._update_stats()
         
         return len(chunks_metadata)
     
     def remove_document_from_index(self, filename: str):
         """
         Remove all chunks of a document from the index.
-        Note: FAISS IndexFlatL2 doesn't support removal, so we rebuild.
+        Note: FAISS flat and HNSW indices don't support removal, so we rebuild.
         
         Args:
             filename: Filename of document to remove
         """
         # Filter out chunks from this document
-        remaining_metadata = [
-            m for m in self.metadata if m["source"] != filename
-        ]
+        keep = np.fromiter(
+            (m["source"] != filename for m in self.metadata), dtype=bool, count=len(self.metadata)
+        )
         
-        if len(remaining_metadata) == len(self.metadata):
+        if keep.all():
             return  # Nothing to remove
         
-        # Rebuild index with remaining chunks
-        self.metadata = remaining_metadata
+        # Rebuild index with remaining chunks, from their stored vectors
+        embeddings = self._stored_embeddings(len(self.metadata))
+        self.metadata = [m for m, kept in zip(self.metadata, keep) if kept]
         
-        if self.metadata:
-            texts = [m["text"] for m in self.metadata]
-            embeddings = self.generate_embeddings(texts)
-            self.index = faiss.IndexFlatL2(EMBEDDING_DIMENSION)
-            self.index.add(embeddings)
+        if embeddings is not None:
+            embeddings = np.ascontiguousarray(embeddings[keep])
+        elif self.metadata:
+            # Sidecar missing: fall back to re-encoding the survivors
+            embeddings = self.generate_embeddings([m["text"] for m in self.metadata])
         else:
-            self.index = faiss.IndexFlatL2(EMBEDDING_DIMENSION)
+            embeddings = np.empty((0, self.embedding_dimension), dtype=np.float32)
+        self.index = self._build_index(embeddings)
+        self._index_mmapped = False
+        
+        # The sidecar no longer matches the log: the caller's _persist
+        # replaces it together with the registry, metadata and index
+        self._pending_embeddings = embeddings
+        self._checkpoint_due = True
+        self.index_version += 1
+        self._update_stats()
+        
+        print(f"Removed document '{filename}' from index")
+    
+    # ============================================
+    # DOCUMENT UPLOAD METHODS
+    # ============================================
+    
+    def _new_doc_id(self) -> str:
+        """Generate a document ID that is not already in the registry."""
+        timestamp = int(datetime.now().timestamp())
+        counter = len(self.documents) + 1
+        doc_id = f"doc_{counter}_{timestamp}"
+        while doc_id in self.documents:
+            counter += 1
+            doc_id = f"doc_{counter}_{timestamp}"
+        return doc_id
+    
+    def _resolve_duplicate(self, filename: str, file_hash: str,
+                           action: str) -> Optional[Dict]:
+        """
+        Apply the duplicate-handling action for a file hash.
+        Must be called with the engine lock held.
+        
+        Args:
+            filename: Original filename
+            file_hash: Dedup hash of the file (compute_file_hash)
+            action: "auto", "use_existing", "replace", or "cancel"
+            
+        Returns:
+            Final result dict, or None if the upload should proceed
+        """
+        existing_doc = self.check_duplicate(file_hash)
+        
+        if not existing_doc:
+            return None
+        
+        if action == "auto":
+            # Return duplicate warning
+            return {
+                "status": "duplicate",
+                "filename": filename,
+                "existing_filename": existing_doc["filename"],
+                "hash": file_hash,
+                "message": f"Document already exists as '{existing_doc['filename']}'",
+                "options": ["use_existing", "replace", "cancel"]
+            }
+        elif action == "use_existing":
+            return {
+                "status": "success",
+                "filename": existing_doc["filename"],
+                "message": "Using existing document embeddings",
+                "chunks": 0,
+                "reused": True
+            }
+        elif action == "cancel":
+            return {
+                "status": "cancelled",
+                "filename": filename,
+                "message": "Upload cancelled"
+            }
+        elif action == "replace":
+            # Remove old document and continue with upload
+            self.remove_document_from_index(existing_doc["filename"])
+            self._unregister_document(existing_doc["doc_id"])
+            self._update_stats()
+            self._persist()
+        
+        return None
+    
+    def upload_document(self, filename: str, file_content: bytes, 
+                        action: str = "auto") -> Dict:
+        """
+        Upload and process a document.
+        
+        Args:
+            filename: Original filename
+            file_content: Raw bytes of PDF
+            action: "auto", "use_existing", "replace", or "cancel"
+            
+        Returns:
+            Result dict with status and info
+        """
+        # Compute hash
+        file_hash = self.compute_file_hash(file_content)
+        return self.embed_and_index_batch([
+            self.parse_and_chunk(filename, file_content, action, file_hash)
+        ])[0]
+    
+    def upload_document_from_path(self, filename: str, file_path: str,
+                                  action: str = "auto",
+                                  file_hash: Optional[str] = None) -> Dict:
+        """
+        Upload and process a document that has been spooled to disk.
+        Avoids holding the whole PDF in memory for large uploads.
+        Duplicates are resolved from the hash alone, before the PDF is parsed.
+        
+        Args:
+            filename: Original filename
+            file_path: Path to the PDF on disk
+            action: "auto", "use_existing", "replace", or "cancel"
+            file_hash: Precomputed compute_file_hash hash of the file (optional)
+            
+        Returns:
+            Result dict with status and info
+        """
+        if file_hash is None:
+            file_hash = self.compute_path_hash(file_path)
+        return self.embed_and_index_batch([
+            self.parse_and_chunk(filename, file_path, action, file_hash)
+        ])[0]
+    
+    def parse_and_chunk(self, filename: str, file_content: Union[bytes, str],
+                        action: str = "auto",
+                        file_hash: Optional[str] = None) -> Tuple[Dict, List[Dict]]:
+        """
+        First upload stage: duplicate check, text extraction and chunking.
+        Cheap relative to embedding, and safe to run for many files in parallel.
+        
+        Args:
+            filename: Original filename
+            file_content: Raw bytes of PDF, or path to the PDF on disk
+            action: "auto", "use_existing", "replace", or "cancel"
+            file_hash: Precomputed compute_file_hash hash of the file (optional)
+            
+        Returns:
+            Tuple of (doc_meta, chunks). doc_meta has status "parsed" when the
+            document still needs indexing; otherwise it is the final result
+            dict and chunks is empty.
+        """
+        if file_hash is None:
+            if isinstance(file_content, (bytes, bytearray)):
+                file_hash = self.compute_file_hash(file_content)
+            else:
+                file_hash = self.compute_path_hash(file_content)
+        
+        # Check for duplicate
+        self._upgrade_legacy_hash(filename, file_hash, file_content)
+        with self._lock:
+            duplicate_result = self._resolve_duplicate(filename, file_hash, action)
+        if duplicate_result:
+            return duplicate_result, []
+        
+        # Process new document
+        try:
+            chunks_metadata = self.process_pdf(filename, file_content)
+        except Exception as e:
+            return {
+                "status": "error",
+                "filename": filename,
+                "message": f"Error processing document: {str(e)}"
+            }, []
+        
+        if not chunks_metadata:
+            return {
+                "status": "error",
+                "filename": filename,
+                "message": "No text could be extracted from PDF"
+            }, []
+        
+        return {
+            "status": "parsed",
+            "filename": filename,
+            "hash": file_hash,
+            "action": action
+        }, chunks_metadata
+    
+    def embed_and_index_batch(self, parsed: List[Tuple[Dict, List[Dict]]]) -> List[Dict]:
+        """
+        Second upload stage: embed the chunks of every parsed document in a
+        single encode call, then index and register each document.
+        
+        Args:
+            parsed: Outputs of parse_and_chunk, one per document
+            
+        Returns:
+            Result dict with status and info for each input, in order
+        """
+        results = [doc_meta for doc_meta, _ in parsed]
+        pending = [i for i, (doc_meta, _) in enumerate(parsed) if doc_meta["status"] == "parsed"]
+        if not pending:
+            return results
+        
+        # One large batch keeps the encoder busy instead of many small ones
+        try:
+            texts = [c["text"] for i in pending for c in parsed[i][1]]
+            embeddings = self.generate_embeddings(texts)
+        except Exception as e:
+            for i in pending:
+                results[i] = {
+                    "status": "error",
+                    "filename": parsed[i][0]["filename"],
+                    "message": f"Error processing document: {str(e)}"
+                }
+            return results
+        
+        # Train a next-tier index for the whole batch before taking the lock
+        prepared = self._prepare_tier_upgrade(embeddings)
+        
+        with self._lock:
+            self._install_tier_upgrade(prepared)
+            offset = 0
+            registered = False
+            for i in pending:
+                doc_meta, chunks_metadata = parsed[i]
+                doc_embeddings = embeddings[offset:offset + len(chunks_metadata)]
+                offset += len(chunks_metadata)
+                filename = doc_meta["filename"]
+                
+                # Another upload (or an earlier file in this batch) may have
+                # registered the same file meanwhile
+                if doc_meta["action"] == "auto":
+                    duplicate_result = self._resolve_duplicate(
+                        filename, doc_meta["hash"], "auto"
+                    )
+                    if duplicate_result:
+                        results[i] = duplicate_result
+                        continue
+                
+                try:
+                    # Add to index
+                    num_chunks = self._add_chunks(chunks_metadata, doc_embeddings)
+                except Exception as e:
+                    results[i] = {
+                        "status": "error",
+                        "filename": filename,
+                        "message": f"Error processing document: {str(e)}"
+                    }
+                    continue
+                
+                # Register document
+                doc_id = self._new_doc_id()
+                num_pages = max(c["page"] for c in chunks_metadata)
+                self._register_document(doc_id, {
+                    "filename": filename,
+                    "hash": doc_meta["hash"],
+                    "upload_timestamp": datetime.now().isoformat(),
+                    "num_chunks": num_chunks,
+                    "num_pages": num_pages
+                })
+                registered = True
+                
+                results[i] = {
+                    "status": "success",
+                    "filename": filename,
+                    "message": f"Document processed successfully",
+                    "chunks": num_chunks,
+                    "pages": num_pages
+                }
+            
+            # Persist changes once for the whole batch
+            if registered:
+                self._update_stats()
+                self._persist()
         
-        print(f"Removed document '{filename}' from index")
+        return results
     
     # ============================================
-    # DOCUMENT UPLOAD METHODS
+    # QUERY AND RETRIEVAL METHODS
     # ============================================
     
-    def upload_document(self, filename: str, file_content: bytes, 
-                        action: str = "auto") -> Dict:
+    def embed_query(self, query: str) -> np.ndarray:
         """
-        Upload and process a document.
+        Embed a single query string, reusing cached embeddings for repeats.
+        Queries are normalized first, so case and spacing variants share an
+        entry. The cache never needs invalidating: a query's embedding does
+        not depend on which documents are indexed.
         
         Args:
-            filename: Original filename
-            file_content: Raw bytes of PDF
-            action: "auto", "use_existing", "replace", or "cancel"
+            query: User's question
             
         Returns:
-            Result dict with status and info
+            1-D float32 unit-length embedding vector (read-only)
         """
-        # Compute hash
-        file_hash = self.compute_file_hash(file_content)
-        
-        # Check for duplicate
-        existing_doc = self.check_duplicate(file_hash)
-        
-        if existing_doc:
-            if action == "auto":
-                # Return duplicate warning
-                return {
-                    "status": "duplicate",
-                    "filename": filename,
-                    "existing_filename": existing_doc["filename"],
-                    "hash": file_hash,
-                    "message": f"Document already exists as '{existing_doc['filename']}'",
-                    "options": ["use_existing", "replace", "cancel"]
-                }
-            elif action == "use_existing":
-                return {
-                    "status": "success",
-                    "filename": existing_doc["filename"],
-                    "message": "Using existing document embeddings",
-                    "chunks": 0,
-                    "reused": True
-                }
-            elif action == "cancel":
-                return {
-                    "status": "cancelled",
-                    "filename": filename,
-                    "message": "Upload cancelled"
-                }
-            elif action == "replace":
-                # Remove old document and continue with upload
-                self.remove_document_from_index(existing_doc["filename"])
-                del self.documents[existing_doc["doc_id"]]
+        return self._embed_queries_cached([query])[0]
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed several query strings, encoding all cache misses in one call.
         
-        # Process new document
-        try:
-            chunks_metadata = self.process_pdf(filename, file_content)
-            
-            if not chunks_metadata:
-                return {
-                    "status": "error",
-                    "filename": filename,
-                    "message": "No text could be extracted from PDF"
-                }
-            
-            # Add to index
-            num_chunks = self.add_to_index(chunks_metadata)
-            
-            # Register document
-            doc_id = f"doc_{len(self.documents) + 1}_{int(datetime.now().timestamp())}"
-            self.documents[doc_id] = {
-                "filename": filename,
-                "hash": file_hash,
-                "upload_timestamp": datetime.now().isoformat(),
-                "num_chunks": num_chunks,
-                "num_pages": max(c["page"] for c in chunks_metadata)
-            }
-            
-            # Persist changes
-            self._save_persistent_data()
-            
-            return {
-                "status": "success",
-                "filename": filename,
-                "message": f"Document processed successfully",
-                "chunks": num_chunks,
-                "pages": self.documents[doc_id]["num_pages"]
-            }
+        Args:
+            queries: User questions
             
-        except Exception as e:
-            return {
-                "status": "error",
-                "filename": filename,
-                "message": f"Error processing document: {str(e)}"
-            }
+        Returns:
+            Float32 array of shape (len(queries), embedding_dimension)
+        """
+        if not queries:
+            return np.empty((0, self.embedding_dimension), dtype=np.float32)
+        return np.stack(self._embed_queries_cached(queries))
     
-    # ============================================
-    # QUERY AND RETRIEVAL METHODS
-    # ============================================
+    def _embed_queries_cached(self, queries: List[str]) -> List[np.ndarray]:
+        """Look queries up in the LRU cache and encode the misses in one batch."""
+        queries = [normalize_query(q) for q in queries]
+        keys = [hashlib.blake2b(q.encode("utf-8"), digest_size=16).digest() for q in queries]
+        embeddings: List[Optional[np.ndarray]] = [None] * len(queries)
+        with self._query_cache_lock:
+            for i, key in enumerate(keys):
+                embedding = self._query_cache.get(key)
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+                    embeddings[i] = embedding
+        
+        # Repeats within the batch are encoded once
+        misses: Dict[bytes, str] = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                misses.setdefault(keys[i], queries[i])
+        if not misses:
+            return embeddings
+        
+        encoded = self.embed_model.encode(
+            list(misses.values()), batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=False,
+            convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+        fresh = {}
+        for key, embedding in zip(misses, encoded):
+            embedding = embedding.copy()  # own buffer, not a view of the batch
+            embedding.flags.writeable = False  # shared between callers
+            fresh[key] = embedding
+        
+        with self._query_cache_lock:
+            for key, embedding in fresh.items():
+                self._query_cache[key] = embedding
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return [fresh[keys[i]] if e is None else e for i, e in enumerate(embeddings)]
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[Dict]:
+    def retrieve_relevant_chunks(self, query: str, top_k: int = DEFAULT_TOP_K,
+                                 query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Retrieve most relevant chunks for a query.
         
         Args:
             query: User's question
             top_k: Number of chunks to retrieve
+            query_embedding: Precomputed embedding of the query (optional)
             
         Returns:
             List of relevant chunks with metadata
@@ -546,84 +2308,245 @@ class RAGEngine:
         if self.index is None or self.index.ntotal == 0:
             return []
         
-        # Limit top_k to available chunks
-        top_k = min(top_k, self.index.ntotal)
-        
         # Embed query
-        query_embedding = self.embed_model.encode([query]).astype("float32")
-        
-        # Search FAISS
-        distances, indices = self.index.search(query_embedding, k=top_k)
-        
-        # Gather results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.metadata):
-                results.append({
-                    **self.metadata[idx],
-                    "distance": float(distances[0][i]),
-                    "relevance_rank": i + 1
-                })
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
-        return results
+        return self.search_batch(query_embedding.reshape(1, -1), top_k)[0]
     
-    def generate_answer(self, query: str, context_chunks: List[Dict]) -> str:
+    def retrieve_relevant_chunks_batch(self, queries: List[str],
+                                       top_k: int = DEFAULT_TOP_K) -> List[List[Dict]]:
         """
-        Generate answer using Gemini with retrieved context.
+        Retrieve the most relevant chunks for several queries with one
+        encoder call and one FAISS search (FAISS parallelizes across the
+        query batch, not within a single query).
         
         Args:
-            query: User's question
-            context_chunks: Retrieved relevant chunks
+            queries: User questions
+            top_k: Number of chunks to retrieve per query
             
         Returns:
-            Generated answer string
+            One list of relevant chunks with metadata per query
         """
-        if not context_chunks:
-            return "I don't have enough information to answer this question. Please upload relevant documents first."
+        return self.search_batch(self.embed_queries(queries), top_k)
+    
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = DEFAULT_TOP_K) -> List[List[Dict]]:
+        """
+        Search the index for several queries in one FAISS call.
+        
+        Args:
+            query_embeddings: Float32 array of shape (n, embedding_dimension)
+            top_k: Number of chunks to retrieve per query
+            
+        Returns:
+            One list of relevant chunks with metadata per query row
+        """
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return [[] for _ in range(len(query_embeddings))]
+            
+            # Limit top_k to available chunks
+            top_k = min(top_k, self.index.ntotal)
+            
+            # Search FAISS
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+            if self.binary_index:
+                distances, indices = self._search_binary(query_embeddings, top_k)
+            else:
+                distances, indices = self._search_index().search(query_embeddings, k=top_k)
+            
+            # Gather results. HNSW and IVF searches pad a row with -1 when
+            # they find fewer than top_k neighbours; the padding is trailing,
+            # so filtering it out keeps the ranks contiguous
+            metadata = self.metadata
+            batch_results = []
+            for row_distances, row_indices in zip(distances, indices):
+                valid = (row_indices >= 0) & (row_indices < len(metadata))
+                batch_results.append([
+                    {
+                        **metadata[idx],
+                        "score": score,  # cosine similarity
+                        "relevance_rank": rank
+                    }
+                    for rank, (idx, score) in enumerate(
+                        zip(row_indices[valid].tolist(), row_distances[valid].tolist()), start=1
+                    )
+                ])
+        
+        return batch_results
+    
+    def _search_binary(self, query_embeddings: np.ndarray,
+                       top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Two-stage search for the binary index: Hamming-distance candidates,
+        re-ranked by exact inner product with their float32 vectors.
+        Must be called with the lock held.
+        
+        Args:
+            query_embeddings: Float32 array of shape (n, embedding_dimension)
+            top_k: Number of results per query (at most index.ntotal)
+            
+        Returns:
+            (scores, ids) arrays of shape (n, top_k), ids padded with -1
+        """
+        num_candidates = min(top_k * BINARY_RERANK_FACTOR, self.index.ntotal)
+        _, candidates = self.index.search(self._index_codes(query_embeddings), num_candidates)
+        
+        if self._rerank_vectors_version != self.index_version:
+            # The sidecar grew or was rewritten since it was last mapped
+            self._rerank_vectors = self._open_embeddings()
+            self._rerank_vectors_version = self.index_version
+        
+        scores = np.full((len(query_embeddings), top_k), -np.inf, dtype=np.float32)
+        ids = np.full((len(query_embeddings), top_k), -1, dtype=np.int64)
+        for row, (query, row_candidates) in enumerate(zip(query_embeddings, candidates)):
+            row_candidates = row_candidates[row_candidates >= 0]
+            row_scores = self._rerank_vectors[row_candidates] @ query
+            best = np.argsort(-row_scores)[:top_k]
+            scores[row, :len(best)] = row_scores[best]
+            ids[row, :len(best)] = row_candidates[best]
+        return scores, ids
+    
+    def _search_index(self) -> faiss.Index:
+        """
+        Index to run searches on: the GPU replica when GPU FAISS is in use,
+        copied from self.index again after the indexed chunks change.
+        Must be called with the lock held.
+        """
+        if not self.use_gpu_search:
+            return self.index
+        
+        if self._gpu_index_version != self.index_version:
+            self._gpu_index_version = self.index_version
+            self._gpu_index = None
+            try:
+                if self._gpu_resources is None:
+                    self._gpu_resources = faiss.StandardGpuResources()
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+            except RuntimeError as e:
+                # HNSW indexes have no GPU version
+                print(f"Searching {type(self.index).__name__} on CPU: {e}")
+        
+        return self._gpu_index if self._gpu_index is not None else self.index
+    
+    @staticmethod
+    def build_context(context_chunks: List[Dict]) -> str:
+        """
+        Format retrieved chunks as the context block of the answer prompt.
         
-        # Build context string
+        Args:
+            context_chunks: Retrieved relevant chunks
+            
+        Returns:
+            Context string with a source header per chunk
+        """
         context_parts = []
         for chunk in context_chunks:
             context_parts.append(
                 f"[Source: {chunk['source']}, Page {chunk['page']}]\n{chunk['text']}"
             )
-        context = "\n\n".join(context_parts)
+        return "\n\n".join(context_parts)
+    
+    @staticmethod
+    def build_answer_prompt(query: str, context: str) -> str:
+        """
+        Build the grounded-answer prompt sent to Gemini with ANSWER_SYSTEM_PROMPT.
         
-        # Create prompt
-        prompt = f"""You are a helpful assistant that answers questions based ONLY on the provided context.
-Do NOT make up information that is not in the context.
-If the context doesn't contain enough information to answer, say so clearly.
-You may summarize, combine, or rephrase information from the context to make your answer clear and helpful.
-
-CONTEXT:
+        Args:
+            query: User's question
+            context: Output of build_context
+            
+        Returns:
+            Prompt string
+        """
+        return f"""CONTEXT:
 {context}
 
 QUESTION:
 {query}
 
 ANSWER:"""
+    
+    def retrieve(self, query: str, top_k: int = DEFAULT_TOP_K,
+                 query_embedding: Optional[np.ndarray] = None) -> Tuple[str, List[Dict]]:
+        """
+        Retrieval half of ask(): find relevant chunks and format the context.
         
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error generating answer: {str(e)}"
+        Args:
+            query: User's question
+            top_k: Number of chunks to retrieve
+            query_embedding: Precomputed embedding of the query (optional)
+            
+        Returns:
+            Tuple of (context string, retrieved chunks)
+        """
+        context_chunks = self.retrieve_relevant_chunks(query, top_k, query_embedding)
+        return self.build_context(context_chunks), context_chunks
     
-    def verify_sources(self, query: str, answer: str, context_chunks: List[Dict]) -> List[int]:
+    def generate_answer(self, query: str, context_chunks: List[Dict]) -> str:
         """
-        Verify which chunks actually support the generated answer.
+        Generate answer using Gemini with retrieved context.
         
         Args:
             query: User's question
-            answer: Generated answer
-            context_chunks: All retrieved chunks
+            context_chunks: Retrieved relevant chunks
             
         Returns:
-            List of indices of chunks that support the answer
+            Generated answer string
+            
+        Raises:
+            Exception: If Gemini fails; partial text is discarded rather
+                than returned as an answer
         """
         if not context_chunks:
-            return []
+            return NO_CONTEXT_ANSWER
+        
+        # Streaming gets the first tokens back before the whole answer is
+        # generated, so most of the generation overlaps the network transfer
+        answer = io.StringIO()
+        for text in self.stream_answer(self.build_context(context_chunks), query):
+            answer.write(text)
+        return answer.getvalue()
+    
+    def stream_answer(self, context: str, query: str) -> Iterator[str]:
+        """
+        Generate an answer with Gemini's streaming API, yielding text as it arrives.
+        
+        Args:
+            context: Output of build_context (empty if nothing was retrieved)
+            query: User's question
+            
+        Yields:
+            Answer text fragments
+            
+        Raises:
+            Exception: Whatever Gemini raised, possibly after some fragments
+                were yielded; errors are never yielded as answer text
+        """
+        if not context:
+            yield NO_CONTEXT_ANSWER
+            return
+        
+        prompt = self.build_answer_prompt(query, context)
+        
+        for chunk in self.gemini_model.generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+    
+    @staticmethod
+    def build_verification_prompt(query: str, answer: str, context_chunks: List[Dict]) -> str:
+        """
+        Build the citation-verification prompt sent to Gemini with
+        VERIFICATION_SYSTEM_PROMPT.
         
+        Args:
+            query: User's question
+            answer: Generated answer
+            context_chunks: All retrieved chunks
+            
+        Returns:
+            Prompt string
+        """
         # Build context with numbered chunks
         context_parts = []
         for i, chunk in enumerate(context_chunks):
@@ -632,14 +2555,7 @@ ANSWER:"""
             )
         context = "\n\n".join(context_parts)
         
-        # Create verification prompt
-        prompt = f"""You are a citation verification assistant. Given a question, an answer, and numbered source chunks, identify which chunks were actually used to generate the answer.
-
-Return ONLY a comma-separated list of chunk numbers that directly support the answer (e.g., "0,2,3").
-If no chunks support the answer, return "NONE".
-Do not include explanations or any other text.
-
-QUESTION:
+        return f"""QUESTION:
 {query}
 
 ANSWER:
@@ -649,64 +2565,112 @@ NUMBERED CHUNKS:
 {context}
 
 CHUNK NUMBERS THAT SUPPORT THE ANSWER:"""
+    
+    @staticmethod
+    def parse_verification(result: str, num_chunks: int) -> List[int]:
+        """
+        Parse Gemini's verification reply into chunk indices.
         
-        try:
-            response = self.gemini_model.generate_content(prompt)
-            result = response.text.strip()
-            
-            # Parse the response
-            if result.upper() == "NONE":
-                return []
+        Args:
+            result: Reply text, e.g. "0,2,3" or "NONE"
+            num_chunks: Number of chunks that were offered
             
-            # Extract numbers
-            used_indices = []
-            for part in result.split(","):
-                try:
-                    idx = int(part.strip())
-                    if 0 <= idx < len(context_chunks):
-                        used_indices.append(idx)
-                except ValueError:
-                    continue
+        Returns:
+            List of valid chunk indices
+        """
+        result = result.strip()
+        if result.upper() == "NONE":
+            return []
+        
+        # Extract numbers
+        used_indices = []
+        for part in result.split(","):
+            try:
+                idx = int(part.strip())
+                if 0 <= idx < num_chunks:
+                    used_indices.append(idx)
+            except ValueError:
+                continue
+        
+        return used_indices
+    
+    def verify_sources(self, query: str, answer: str, context_chunks: List[Dict]) -> List[int]:
+        """
+        Verify which chunks actually support the generated answer.
+        
+        Args:
+            query: User's question
+            answer: Generated answer
+            context_chunks: All retrieved chunks
             
-            return used_indices
+        Returns:
+            List of indices of chunks that support the answer
+        """
+        if not context_chunks:
+            return []
+        
+        prompt = self.build_verification_prompt(query, answer, context_chunks)
+        
+        try:
+            response = self.verification_model.generate_content(prompt)
+            return self.parse_verification(response.text, len(context_chunks))
         except Exception as e:
             print(f"Error verifying sources: {e}")
             # Fallback: return all chunks if verification fails
             return list(range(len(context_chunks)))
     
-    def ask(self, query: str, top_k: int = DEFAULT_TOP_K) -> Dict:
+    @staticmethod
+    def _sources_from_indices(used_indices: List[int], context_chunks: List[Dict]) -> List[Dict]:
+        """Turn verified chunk indices into deduplicated {"file", "page"} citations."""
+        # dict.fromkeys drops repeats and keeps first-seen order
+        source_keys = dict.fromkeys(
+            (context_chunks[idx]["source"], context_chunks[idx]["page"])
+            for idx in used_indices
+            if idx < len(context_chunks)
+        )
+        return [{"file": source, "page": page} for source, page in source_keys]
+    
+    def select_sources(self, query: str, answer: str, context_chunks: List[Dict]) -> List[Dict]:
+        """
+        Verify which chunks support the answer and return them as citations.
+        
+        Args:
+            query: User's question
+            answer: Generated answer
+            context_chunks: All retrieved chunks
+            
+        Returns:
+            Deduplicated list of {"file", "page"} dicts
+        """
+        used_indices = self.verify_sources(query, answer, context_chunks)
+        return self._sources_from_indices(used_indices, context_chunks)
+    
+    def ask(self, query: str, top_k: int = DEFAULT_TOP_K,
+            query_embedding: Optional[np.ndarray] = None,
+            context_chunks: Optional[List[Dict]] = None) -> Dict:
         """
         Main query method: retrieve context, generate answer, and filter sources.
         
         Args:
             query: User's question
             top_k: Number of chunks to retrieve
+            query_embedding: Precomputed embedding of the query (optional)
+            context_chunks: Already-retrieved chunks; skips retrieval (optional)
             
         Returns:
             Dict with answer and verified sources
         """
         # Retrieve relevant chunks
-        relevant_chunks = self.retrieve_relevant_chunks(query, top_k)
+        if context_chunks is not None:
+            relevant_chunks = context_chunks
+        else:
+            relevant_chunks = self.retrieve_relevant_chunks(query, top_k, query_embedding)
         
         # Generate answer
         answer = self.generate_answer(query, relevant_chunks)
         
-        # Verify which chunks actually support the answer
-        used_indices = self.verify_sources(query, answer, relevant_chunks)
-        
-        # Filter sources to only those that support the answer
-        sources = []
-        seen = set()
-        for idx in used_indices:
-            if idx < len(relevant_chunks):
-                chunk = relevant_chunks[idx]
-                source_key = f"{chunk['source']}_{chunk['page']}"
-                if source_key not in seen:
-                    sources.append({
-                        "file": chunk["source"],
-                        "page": chunk["page"]
-                    })
-                    seen.add(source_key)
+        # Keep only the sources that support the answer
+        sources = self.select_sources(query, answer, relevant_chunks)
         
         return {
             "answer": answer,
@@ -715,6 +2679,79 @@ CHUNK NUMBERS THAT SUPPORT THE ANSWER:"""
             "num_chunks_retrieved": len(relevant_chunks)
         }
     
+    # ============================================
+    # ASYNC QUERY METHODS (Gemini REST over httpx)
+    # ============================================
+    
+    async def generate_answer_async(self, query: str, context_chunks: List[Dict]) -> str:
+        """Async generate_answer(): awaits Gemini on the event loop; errors propagate."""
+        if not context_chunks:
+            return NO_CONTEXT_ANSWER
+        
+        prompt = self.build_answer_prompt(query, self.build_context(context_chunks))
+        return await self.gemini_client.generate(prompt, ANSWER_SYSTEM_PROMPT)
+    
+    async def stream_answer_async(self, context: str, query: str) -> AsyncIterator[str]:
+        """Async stream_answer(): yields text from Gemini's SSE stream; errors propagate."""
+        if not context:
+            yield NO_CONTEXT_ANSWER
+            return
+        
+        prompt = self.build_answer_prompt(query, context)
+        
+        async for text in self.gemini_client.stream(prompt, ANSWER_SYSTEM_PROMPT):
+            yield text
+    
+    async def verify_sources_async(self, query: str, answer: str,
+                                   context_chunks: List[Dict]) -> List[int]:
+        """Async verify_sources()."""
+        if not context_chunks:
+            return []
+        
+        prompt = self.build_verification_prompt(query, answer, context_chunks)
+        
+        try:
+            result = await self.gemini_client.generate(prompt, VERIFICATION_SYSTEM_PROMPT)
+            return self.parse_verification(result, len(context_chunks))
+        except Exception as e:
+            print(f"Error verifying sources: {e}")
+            # Fallback: return all chunks if verification fails
+            return list(range(len(context_chunks)))
+    
+    async def select_sources_async(self, query: str, answer: str,
+                                   context_chunks: List[Dict]) -> List[Dict]:
+        """Async select_sources()."""
+        used_indices = await self.verify_sources_async(query, answer, context_chunks)
+        return self._sources_from_indices(used_indices, context_chunks)
+    
+    async def ask_async(self, query: str, context_chunks: Optional[List[Dict]] = None,
+                        top_k: int = DEFAULT_TOP_K) -> Dict:
+        """
+        Async ask(): generate the answer and filter sources without holding
+        a worker thread during Gemini calls.
+        
+        Args:
+            query: User's question
+            context_chunks: Already-retrieved chunks; skips retrieval (optional)
+            top_k: Number of chunks to retrieve when context_chunks is omitted
+            
+        Returns:
+            Dict with answer and verified sources
+        """
+        if context_chunks is None:
+            # Encoding and search are CPU-bound, so keep them off the event loop
+            context_chunks = await asyncio.to_thread(self.retrieve_relevant_chunks, query, top_k)
+        
+        answer = await self.generate_answer_async(query, context_chunks)
+        sources = await self.select_sources_async(query, answer, context_chunks)
+        
+        return {
+            "answer": answer,
+            "sources": sources,
+            "num_chunks_used": len(sources),
+            "num_chunks_retrieved": len(context_chunks)
+        }
+    
     # ============================================
     # DOCUMENT MANAGEMENT METHODS
     # ============================================
@@ -741,22 +2778,24 @@ CHUNK NUMBERS THAT SUPPORT THE ANSWER:"""
         Returns:
             Result dict
         """
-        if doc_id not in self.documents:
-            return {
-                "status": "error",
-                "message": f"Document {doc_id} not found"
-            }
-        
-        filename = self.documents[doc_id]["filename"]
-        
-        # Remove from index
-        self.remove_document_from_index(filename)
-        
-        # Remove from registry
-        del self.documents[doc_id]
-        
-        # Persist changes
-        self._save_persistent_data()
+        with self._lock:
+            if doc_id not in self.documents:
+                return {
+                    "status": "error",
+                    "message": f"Document {doc_id} not found"
+                }
+            
+            filename = self.documents[doc_id]["filename"]
+            
+            # Remove from index
+            self.remove_document_from_index(filename)
+            
+            # Remove from registry
+            self._unregister_document(doc_id)
+            self._update_stats()
+            
+            # Persist changes
+            self._persist()
         
         return {
             "status": "success",
@@ -774,6 +2813,25 @@ CHUNK NUMBERS THAT SUPPORT THE ANSWER:"""
             "total_documents": len(self.documents),
             "total_chunks": len(self.metadata),
             "index_size": self.index.ntotal if self.index else 0,
-            "embedding_model": EMBEDDING_MODEL_NAME,
-            "embedding_dimension": EMBEDDING_DIMENSION
+            "embedding_model": self.embedding_model_name,
+            "embedding_dimension": self.embedding_dimension
         }
+    
+    def _update_stats(self):
+        """Refresh the cached stats snapshot and its ETag after a mutation."""
+        stats = self.get_stats()
+        digest = hashlib.blake2b(
+            json.dumps(stats, sort_keys=True).encode("utf-8"), digest_size=8
+        ).hexdigest()
+        # Single assignment so lock-free readers always see a consistent pair
+        self._stats_snapshot = (stats, f'W/"{digest}"')
+    
+    def get_stats_cached(self) -> Tuple[Dict, str]:
+        """
+        Get system statistics without touching the index or registry.
+        Cheap enough to call directly from the event loop.
+        
+        Returns:
+            Tuple of (stats dict, weak ETag); do not mutate the dict
+        """
+        return self._stats_snapshot